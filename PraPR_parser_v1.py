@@ -1,8 +1,17 @@
 import os
-import json
+from matrix_format import dump_result, get_output_extension
+from parse_cache import ParseManifest, get_input_info
+from entity_index import add_entity_index
+from patch_record import IntListColumn
+from mutant_log import parse_mutant_log
+import argparse
 from pprint import pprint
 
 
+# bump whenever the parsed output changes, so cached versions get reparsed
+PARSER_VERSION = "2"
+
+
 def get_patch_category(fp_len, pf_len, ff_len):
     patch_category = ""
     if fp_len > 0 and pf_len == 0 and ff_len == 0:
@@ -27,10 +36,12 @@ def get_patch_category(fp_len, pf_len, ff_len):
 
 
 class PraPRParser:
-    def __init__(self, data_dir, output_dir, project_list=["Mockito"]):
+    def __init__(self, data_dir, output_dir, project_list=["Mockito"], output_format="json"):
         self._data_dir = data_dir
         self._output_dir = output_dir
         self.project_list = project_list
+        # "json" (indent=4) or "binary" (see matrix_format.py)
+        self._output_format = output_format
         self.separator = "^^^^^"
 
     
@@ -49,38 +60,10 @@ class PraPRParser:
 
 
     def _parse_mutant_log(self, mutant_log_filename):
-        def parse_tests(test_str):
-            test_ids = [int(i) for i in test_str.lstrip(" ").rstrip(" \n").split(" ") if len(i) > 0]
-            return test_ids
-
-        patch_dict = {}
-        with open(mutant_log_filename) as file:
-            patch_id = 0
-            for line in file:
-                if self.separator in line:
-                    tag, mutator, method, testOrder, testFail = line.split(self.separator)
-                    modified_line_num = int(tag.split(":")[-1])
-                    test_execution_list = parse_tests(testOrder)
-                    failed_test_list = parse_tests(testFail)
-                    ordered_failed_test_list = []
-
-                    for test_i in test_execution_list:
-                        if test_i in failed_test_list:
-                            ordered_failed_test_list.append(test_i)
-
-                    patch_dict[patch_id] = {
-                        "method": method,
-                        "line": modified_line_num,
-                        "test_execution_list": test_execution_list,
-                        "failed_test_list": ordered_failed_test_list,
-                    }
+        return parse_mutant_log(mutant_log_filename)
 
-                    patch_id += 1
 
-        return patch_dict
-
-
-    def _change_test_execution_order(self, patch_dict, test_dict):
+    def _change_test_execution_order(self, patch_table, test_dict):
         failed_test_list = []
         passed_test_list = []
         # test name -> test_id
@@ -99,118 +82,162 @@ class PraPRParser:
         ordered_test_list = sorted(failed_test_list) + sorted(passed_test_list)
         ordered_test_id_list = [test_name2id_dict[test_name] for test_name in ordered_test_list]
 
-        # revise patch dict
-        for _, patch_data in patch_dict.items():
-            test_execution_list = patch_data["test_execution_list"]
-            reordered_test_execution_list = [test_i for test_i in ordered_test_id_list if test_i in test_execution_list]
-            patch_data["test_execution_list"] = reordered_test_execution_list
-
-            failed_test_list = patch_data["failed_test_list"]
-            reordered_failed_test_list = [test_i for test_i in ordered_test_id_list if test_i in failed_test_list]
-            patch_data["failed_test_list"] = reordered_failed_test_list
-
-
-    def _merge_result(self, patch_dict, test_dict):
-        merged_result_dict = {}
-        method_id_mapping = {}
-        id_method_mapping = {}
-
-        for patch_id, patch_data in patch_dict.items():
+        # test_id -> dense indexes (positions) in ordered_test_id_list
+        test_idx_dict = {}
+        for test_idx, test_id in enumerate(ordered_test_id_list):
+            if test_id not in test_idx_dict:
+                test_idx_dict[test_id] = []
+            test_idx_dict[test_id].append(test_idx)
+
+        # sorting the dense indexes of a patch's tests costs O(k log k) instead of O(#tests * k)
+        def reorder_tests(test_list):
+            test_idx_list = []
+            for test_i in set(test_list):
+                if test_i in test_idx_dict:
+                    test_idx_list.extend(test_idx_dict[test_i])
+            test_idx_list.sort()
+            return [ordered_test_id_list[test_idx] for test_idx in test_idx_list]
+
+        # revise patch table
+        test_execution_column = IntListColumn()
+        failed_test_column = IntListColumn()
+        for test_execution_list, failed_test_list in zip(patch_table.test_execution_column, patch_table.failed_test_column):
+            test_execution_column.append(reorder_tests(test_execution_list))
+            failed_test_column.append(reorder_tests(failed_test_list))
+        patch_table.test_execution_column = test_execution_column
+        patch_table.failed_test_column = failed_test_column
+
+
+    def _merge_result(self, patch_table, test_dict):
+        # one pass gives both matrices: the partial matrix only counts the tests up to
+        # (and including) the first failing test of the patch
+        full_result_dict = {}
+        partial_result_dict = {}
+
+        for patch_id in range(len(patch_table)):
             pf, pp, ff, fp = [0, 0, 0, 0]
-            for executed_test_id in patch_data["test_execution_list"]:
+            partial_count = None
+            failed_test_set = set(patch_table.failed_test_column[patch_id])
+            for executed_test_id in patch_table.test_execution_column[patch_id]:
                 org_test_result = test_dict[executed_test_id]["test_result"]
+                is_failed = executed_test_id in failed_test_set
                 if org_test_result == "P":
-                    if executed_test_id in patch_data["failed_test_list"]:
+                    if is_failed:
                         pf += 1
                     else:
                         pp += 1
 
                 if org_test_result == "F":
-                    if executed_test_id in patch_data["failed_test_list"]:
+                    if is_failed:
                         ff += 1
                     else:
                         fp += 1
 
-            method_str = patch_data["method"]
-            if method_str not in method_id_mapping:
-                method_id = len(method_id_mapping.keys())
-                method_id_mapping[method_str] = method_id
-                id_method_mapping[method_id] = method_str
+                if is_failed and partial_count is None:
+                    partial_count = [pf, pp, ff, fp]
+
+            if partial_count is None:
+                partial_count = [pf, pp, ff, fp]
+
+            for result_dict, (pf, pp, ff, fp) in [
+                (full_result_dict, [pf, pp, ff, fp]),
+                (partial_result_dict, partial_count),
+            ]:
+                result_dict[patch_id] = {
+                    "method": patch_table.method_column[patch_id],
+                    "line": patch_table.line_column[patch_id],
+                    "pf_len": pf,
+                    "pp_len": pp,
+                    "ff_len": ff,
+                    "fp_len": fp,
+                    "patch_category": get_patch_category(fp, pf, ff),
+                }
+
+        # method codes of the patch table are assigned in patch order, so they are the method ids
+        return full_result_dict, partial_result_dict, patch_table.get_method_mapping()
 
-            merged_result_dict[patch_id] = {
-                "method": method_id_mapping[method_str],
-                "line": patch_data["line"],
-                "pf_len": pf,
-                "pp_len": pp,
-                "ff_len": ff,
-                "fp_len": fp,
-                "patch_category": get_patch_category(fp, pf, ff),
-            }
 
-        return merged_result_dict, id_method_mapping
+    def _get_input_file_list(self, project, version):
+        mutant_log_filename = os.path.join(self._data_dir, project, "{}_mutantlog".format(version))
+        test_log_filename = os.path.join(self._data_dir, project, "{}_testLog".format(version))
+        return [mutant_log_filename, test_log_filename]
 
 
-    def _truncate_test_excution(self, patch_dict):
-        for _, patch_data in patch_dict.items():
-            if len(patch_data["failed_test_list"]) > 0:
-                first_failed_test_id = patch_data["failed_test_list"][0]
-                first_failed_test_idx = patch_data["test_execution_list"].index(first_failed_test_id)
-                patch_data["test_execution_list"] = patch_data["test_execution_list"][: first_failed_test_idx + 1]
+    def _get_output_filename(self, project, version, matrix_type):
+        return os.path.join(
+            self._output_dir, matrix_type, "{}_{}{}".format(project, version, get_output_extension(self._output_format))
+        )
 
 
     def parse_version_i(self, project, version):
         print("processing {} - {}".format(project, version))
 
-        mutant_log_filename = os.path.join(self._data_dir, project, "{}_mutantlog".format(version))
-        test_log_filename = os.path.join(self._data_dir, project, "{}_testLog".format(version))
+        mutant_log_filename, test_log_filename = self._get_input_file_list(project, version)
 
-        patch_dict = self._parse_mutant_log(mutant_log_filename)
+        patch_table = self._parse_mutant_log(mutant_log_filename)
         test_dict = self._parse_test_log(test_log_filename)
 
-        self._change_test_execution_order(patch_dict, test_dict)
-        merged_result_dict, id_method_mapping = self._merge_result(patch_dict, test_dict)
+        self._change_test_execution_order(patch_table, test_dict)
+        full_result_dict, partial_result_dict, id_method_mapping = self._merge_result(patch_table, test_dict)
+
+        full_result = {
+            "patch": full_result_dict,
+            "method": id_method_mapping,
+            "test": test_dict,
+        }
+        partial_result = {
+            "patch": partial_result_dict,
+            "method": id_method_mapping,
+            "test": test_dict,
+        }
+        # package/class/statement ids per patch, so rerankers can switch level without string processing
+        add_entity_index([full_result, partial_result])
         
         # save full result
-        full_output_dir = os.path.join(self._output_dir, "full")
-        os.makedirs(full_output_dir, exist_ok=True)
-        full_output_filename = os.path.join(full_output_dir, "{}_{}.json".format(project, version))
+        full_output_filename = self._get_output_filename(project, version, "full")
+        os.makedirs(os.path.dirname(full_output_filename), exist_ok=True)
 
-        with open(full_output_filename, 'w') as json_file:
-            json.dump({
-                "patch": merged_result_dict,
-                "method": id_method_mapping,
-                "test": test_dict,
-            }, json_file, indent=4)
+        dump_result(full_result, full_output_filename, self._output_format)
 
 
         # save partial result
-        partial_output_dir = os.path.join(self._output_dir, "partial")
-        os.makedirs(partial_output_dir, exist_ok=True)
-        partial_output_filename = os.path.join(partial_output_dir, "{}_{}.json".format(project, version))
-
-        self._truncate_test_excution(patch_dict)
-        merged_result_dict, id_method_mapping = self._merge_result(patch_dict, test_dict)
+        partial_output_filename = self._get_output_filename(project, version, "partial")
+        os.makedirs(os.path.dirname(partial_output_filename), exist_ok=True)
 
-        with open(partial_output_filename, 'w') as json_file:
-            json.dump({
-                "patch": merged_result_dict,
-                "method": id_method_mapping,
-                "test": test_dict,
-            }, json_file, indent=4)
+        dump_result(partial_result, partial_output_filename, self._output_format)
 
 
-    def process_all(self):
+    def process_all(self, force=False):
+        # versions whose inputs and parser version match the manifest are skipped unless force
+        manifest = ParseManifest(self._output_dir, PARSER_VERSION, self._output_format)
         for project in self.project_list:
             project_dir = os.path.join(self._data_dir, project)
             version_list = [int(i.replace("_testLog", "")) for i in os.listdir(project_dir) if i.endswith("_testLog")]
             for version in version_list:
+                input_file_list = self._get_input_file_list(project, version)
+                output_file_list = [self._get_output_filename(project, version, i) for i in ["full", "partial"]]
+                key = "{}_{}".format(project, version)
+                if not force and manifest.is_fresh(key, input_file_list, output_file_list):
+                    print("skipping {} - {}, up to date".format(project, version))
+                    continue
+
+                input_info_dict = get_input_info(input_file_list)
                 self.parse_version_i(project, version)
+                manifest.update(key, input_info_dict)
+                manifest.save()
+
+        # keeps refreshed mtimes of touched but unchanged inputs
+        manifest.save()
 
 
 if __name__ == "__main__":
     data_dir = "/filesystem/patch_ranking/ProflPartialMatrix/python/data/prapr/trash"
     output_dir = "output"
     project_list = ["Mockito"]
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--force", action="store_true", help="reparse versions that are up to date in the manifest")
+    args = arg_parser.parse_args()
+
     pp = PraPRParser(data_dir, output_dir, project_list)
-    pp.process_all()
+    pp.process_all(force=args.force)
 
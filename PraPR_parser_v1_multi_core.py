@@ -1,9 +1,23 @@
 import os
-import json
+import io
+from matrix_format import dump_result, encode_result, get_output_extension
+from parse_cache import ParseManifest, get_data_hash, get_file_info, get_input_info
+from entity_index import add_entity_index
+from instrument import StageTimer, write_report
+from patch_record import IntListColumn, PatchTable
+from mutant_log import parse_mutant_bytes, parse_mutant_file, parse_mutant_log
+from shared_test_table import TestTable
+from pipeline import PipelineExecutor
+import argparse
 import multiprocessing
+import time
 from pprint import pprint
 
 
+# bump whenever the parsed output changes, so cached versions get reparsed
+PARSER_VERSION = "2"
+
+
 def get_patch_category(fp_len, pf_len, ff_len):
     patch_category = ""
     if fp_len > 0 and pf_len == 0 and ff_len == 0:
@@ -28,71 +42,115 @@ def get_patch_category(fp_len, pf_len, ff_len):
 
 
 class PraPRParser:
-    def __init__(self, data_dir, output_dir, project="Closure", num_cores=8):
+    def __init__(
+        self,
+        data_dir,
+        output_dir,
+        project="Closure",
+        num_cores=8,
+        output_format="json",
+        project_list=None,
+        split_size=64 << 20,
+        test_output="inline",
+        pipeline=False,
+        instrument=False,
+    ):
         self._data_dir = data_dir
         self._output_dir = output_dir
         self.project = project
+        # all projects share one pool, project is kept for parse_version_i(version)
+        self.project_list = project_list if project_list is not None else [project]
         self.num_cores = num_cores
+        # "json" (indent=4) or "binary" (see matrix_format.py)
+        self._output_format = output_format
         self.separator = "^^^^^"
+        # mutant logs of at least split_size bytes are parsed in byte-range chunks across the pool
+        self.split_size = split_size
+        # "inline": the test table is written into both the full and the partial file,
+        # "sidecar": written once to <output_dir>/test/<project>_<version>.json instead
+        assert test_output in ["inline", "sidecar"], "unknown test output {}".format(test_output)
+        self._test_output = test_output
+        # read the inputs of the next versions and write the outputs in threads of the parent
+        # while the pool computes, instead of each worker reading, parsing and dumping in turn
+        self._pipeline = pipeline
+        # per-stage wall/cpu time and peak rss of every version, see instrument.py
+        self._stage_timer = StageTimer(instrument)
 
     
     def _parse_test_log(self, test_log_filename):
-        test_dict = {}
-
-        with open(test_log_filename) as file:
-            for line in file:
-                test_name, test_id, test_result = line.rstrip("\n").split(" ")
-                test_dict[int(test_id)] = {
-                    "test": test_name,
-                    "test_result": test_result,
-                }
-
-        return test_dict
+        return TestTable.from_test_log(test_log_filename)
 
 
     def _parse_mutant_log(self, mutant_log_filename):
-        def parse_tests(test_str):
-            test_ids = [int(i) for i in test_str.lstrip(" ").rstrip(" \n").split(" ") if len(i) > 0]
-            return test_ids
-
-        patch_dict = {}
-        with open(mutant_log_filename) as file:
-            patch_id = 0
-            for line in file:
-                if self.separator in line:
-                    tag, mutator, method, testOrder, testFail = line.split(self.separator)
-                    modified_line_num = int(tag.split(":")[-1])
-                    test_execution_list = parse_tests(testOrder)
-                    failed_test_list = parse_tests(testFail)
-                    ordered_failed_test_list = []
-                    
-                    for test_i in test_execution_list:
-                        if test_i in failed_test_list:
-                            ordered_failed_test_list.append(test_i)
-
-                    patch_dict[patch_id] = {
-                        "method": method,
-                        "line": modified_line_num,
-                        "test_execution_list": test_execution_list,
-                        "failed_test_list": ordered_failed_test_list,
-                    }
-
-                    patch_id += 1
-
-        return patch_dict
-
-
-    def _change_test_execution_order(self, patch_dict, test_dict):
+        return parse_mutant_log(mutant_log_filename)
+
+
+    def _get_byte_range_list(self, filename, num_chunks):
+        # cut points are moved forward to the next line start, so no line spans two chunks
+        file_size = os.path.getsize(filename)
+        offset_list = [0]
+        with open(filename, "rb") as file:
+            for chunk_i in range(1, num_chunks):
+                offset = max(file_size * chunk_i // num_chunks, offset_list[-1])
+                if offset > 0:
+                    file.seek(offset - 1)
+                    file.readline()
+                    offset = file.tell()
+                offset_list.append(offset)
+        offset_list.append(file_size)
+
+        return [(filename, start, end) for start, end in zip(offset_list, offset_list[1:]) if start < end]
+
+
+    def _parse_mutant_log_range(self, byte_range):
+        filename, start, end, test_table_name = byte_range
+        with open(filename, "rb") as file:
+            file.seek(start)
+            data = file.read(end - start)
+
+        patch_table = parse_mutant_bytes(data)
+
+        # the test order only depends on the test table, so each chunk can reorder its own patches
+        if test_table_name is not None:
+            test_table = TestTable.from_shared_memory(test_table_name)
+            self._change_test_execution_order(patch_table, test_table)
+            test_table.close()
+
+        return patch_table
+
+
+    def _parse_mutant_log_parallel(self, mutant_log_filename, pool, test_table=None):
+        # with a test_table the chunks come back with their tests already reordered,
+        # workers read the table from one shared memory block instead of a pickled copy each
+        shm = test_table.to_shared_memory() if test_table is not None else None
+        byte_range_list = [
+            byte_range + (shm.name if shm is not None else None,)
+            for byte_range in self._get_byte_range_list(mutant_log_filename, self.num_cores)
+        ]
+
+        # chunks come back in file order, so concatenating them keeps the sequential patch ids
+        patch_table = PatchTable()
+        try:
+            for chunk_patch_table in pool.map(self._parse_mutant_log_range, byte_range_list):
+                patch_table.extend(chunk_patch_table)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        return patch_table
+
+
+    def _change_test_execution_order(self, patch_table, test_table):
         failed_test_list = []
         passed_test_list = []
         # test name -> test_id
         test_name2id_dict = {}
-        for test_id, test_info in test_dict.items():
-            test_name = test_info["test"]
-            if test_info["test_result"] == "P":
+        for test_id, test_name, test_result in test_table.items():
+            if test_result == "P":
                 passed_test_list.append(test_name)
 
-            if test_info["test_result"] == "F":
+            if test_result == "F":
                 failed_test_list.append(test_name)
 
             test_name2id_dict[test_name] = test_id
@@ -101,117 +159,354 @@ class PraPRParser:
         ordered_test_list = sorted(failed_test_list) + sorted(passed_test_list)
         ordered_test_id_list = [test_name2id_dict[test_name] for test_name in ordered_test_list]
 
-        # revise patch dict
-        for _, patch_data in patch_dict.items():
-            test_execution_list = patch_data["test_execution_list"]
-            reordered_test_execution_list = [test_i for test_i in ordered_test_id_list if test_i in test_execution_list]
-            patch_data["test_execution_list"] = reordered_test_execution_list
-
-            failed_test_list = patch_data["failed_test_list"]
-            reordered_failed_test_list = [test_i for test_i in ordered_test_id_list if test_i in failed_test_list]
-            patch_data["failed_test_list"] = reordered_failed_test_list
-
-
-    def _merge_result(self, patch_dict, test_dict):
-        merged_result_dict = {}
-        method_id_mapping = {}
-        id_method_mapping = {}
-
-        for patch_id, patch_data in patch_dict.items():
+        # test_id -> dense indexes (positions) in ordered_test_id_list
+        test_idx_dict = {}
+        for test_idx, test_id in enumerate(ordered_test_id_list):
+            if test_id not in test_idx_dict:
+                test_idx_dict[test_id] = []
+            test_idx_dict[test_id].append(test_idx)
+
+        # sorting the dense indexes of a patch's tests costs O(k log k) instead of O(#tests * k)
+        def reorder_tests(test_list):
+            test_idx_list = []
+            for test_i in set(test_list):
+                if test_i in test_idx_dict:
+                    test_idx_list.extend(test_idx_dict[test_i])
+            test_idx_list.sort()
+            return [ordered_test_id_list[test_idx] for test_idx in test_idx_list]
+
+        # revise patch table
+        test_execution_column = IntListColumn()
+        failed_test_column = IntListColumn()
+        for test_execution_list, failed_test_list in zip(patch_table.test_execution_column, patch_table.failed_test_column):
+            test_execution_column.append(reorder_tests(test_execution_list))
+            failed_test_column.append(reorder_tests(failed_test_list))
+        patch_table.test_execution_column = test_execution_column
+        patch_table.failed_test_column = failed_test_column
+
+
+    def _merge_result(self, patch_table, test_table):
+        # one pass gives both matrices: the partial matrix only counts the tests up to
+        # (and including) the first failing test of the patch
+        full_result_dict = {}
+        partial_result_dict = {}
+        test_result_dict = test_table.get_result_dict()
+
+        for patch_id in range(len(patch_table)):
             pf, pp, ff, fp = [0, 0, 0, 0]
-            for executed_test_id in patch_data["test_execution_list"]:
-                org_test_result = test_dict[executed_test_id]["test_result"]
+            partial_count = None
+            failed_test_set = set(patch_table.failed_test_column[patch_id])
+            for executed_test_id in patch_table.test_execution_column[patch_id]:
+                org_test_result = test_result_dict[executed_test_id]
+                is_failed = executed_test_id in failed_test_set
                 if org_test_result == "P":
-                    if executed_test_id in patch_data["failed_test_list"]:
+                    if is_failed:
                         pf += 1
                     else:
                         pp += 1
 
                 if org_test_result == "F":
-                    if executed_test_id in patch_data["failed_test_list"]:
+                    if is_failed:
                         ff += 1
                     else:
                         fp += 1
 
-            method_str = patch_data["method"]
-            if method_str not in method_id_mapping:
-                method_id = len(method_id_mapping.keys())
-                method_id_mapping[method_str] = method_id
-                id_method_mapping[method_id] = method_str
+                if is_failed and partial_count is None:
+                    partial_count = [pf, pp, ff, fp]
+
+            if partial_count is None:
+                partial_count = [pf, pp, ff, fp]
+
+            for result_dict, (pf, pp, ff, fp) in [
+                (full_result_dict, [pf, pp, ff, fp]),
+                (partial_result_dict, partial_count),
+            ]:
+                result_dict[patch_id] = {
+                    "method": patch_table.method_column[patch_id],
+                    "line": patch_table.line_column[patch_id],
+                    "pf_len": pf,
+                    "pp_len": pp,
+                    "ff_len": ff,
+                    "fp_len": fp,
+                    "patch_category": get_patch_category(fp, pf, ff),
+                }
 
-            merged_result_dict[patch_id] = {
-                "method": method_id_mapping[method_str],
-                "line": patch_data["line"],
-                "pf_len": pf,
-                "pp_len": pp,
-                "ff_len": ff,
-                "fp_len": fp,
-                "patch_category": get_patch_category(fp, pf, ff),
-            }
+        # method codes of the patch table are assigned in patch order, so they are the method ids
+        return full_result_dict, partial_result_dict, patch_table.get_method_mapping()
 
-        return merged_result_dict, id_method_mapping
 
-    
-    def _truncate_test_excution(self, patch_dict):
-        for _, patch_data in patch_dict.items():
-            if len(patch_data["failed_test_list"]) > 0:
-                first_failed_test_id = patch_data["failed_test_list"][0]
-                first_failed_test_idx = patch_data["test_execution_list"].index(first_failed_test_id)
-                patch_data["test_execution_list"] = patch_data["test_execution_list"][: first_failed_test_idx + 1]
-
-
-    def parse_version_i(self, version):
-        print("processing {} - {}".format(self.project, version))
-
-        mutant_log_filename = os.path.join(self._data_dir, self.project, "{}_mutantlog".format(version))
-        test_log_filename = os.path.join(self._data_dir, self.project, "{}_testLog".format(version))
-
-        patch_dict = self._parse_mutant_log(mutant_log_filename)
-        test_dict = self._parse_test_log(test_log_filename)
-
-        self._change_test_execution_order(patch_dict, test_dict)
-        merged_result_dict, id_method_mapping = self._merge_result(patch_dict, test_dict)
-        
-        # save full result
-        full_output_dir = os.path.join(self._output_dir, "full")
-        os.makedirs(full_output_dir, exist_ok=True)
-        full_output_filename = os.path.join(full_output_dir, "{}_{}.json".format(self.project, version))
-
-        with open(full_output_filename, 'w') as json_file:
-            json.dump({
-                "patch": merged_result_dict,
-                "method": id_method_mapping,
-                "test": test_dict,
-            }, json_file, indent=4)
-
-        # save partial result
-        partial_output_dir = os.path.join(self._output_dir, "partial")
-        os.makedirs(partial_output_dir, exist_ok=True)
-        partial_output_filename = os.path.join(partial_output_dir, "{}_{}.json".format(self.project, version))
-
-        self._truncate_test_excution(patch_dict)
-        merged_result_dict, id_method_mapping = self._merge_result(patch_dict, test_dict)
-
-        with open(partial_output_filename, 'w') as json_file:
-            json.dump({
-                "patch": merged_result_dict,
-                "method": id_method_mapping,
-                "test": test_dict,
-            }, json_file, indent=4)
-    
+    def _get_input_file_list(self, project, version):
+        mutant_log_filename = os.path.join(self._data_dir, project, "{}_mutantlog".format(version))
+        test_log_filename = os.path.join(self._data_dir, project, "{}_testLog".format(version))
+        return [mutant_log_filename, test_log_filename]
+
 
-    def process_all(self):
-        project_dir = os.path.join(self._data_dir, self.project)
-        version_list = [int(i.replace("_testLog", "")) for i in os.listdir(project_dir) if i.endswith("_testLog")]
+    def _get_output_filename(self, project, version, matrix_type):
+        return os.path.join(
+            self._output_dir, matrix_type, "{}_{}{}".format(project, version, get_output_extension(self._output_format))
+        )
+
+
+    def _get_test_output_filename(self, project, version):
+        return os.path.join(self._output_dir, "test", "{}_{}.json".format(project, version))
+
+
+    def _get_all_output_filename(self, project, version):
+        output_file_list = [self._get_output_filename(project, version, i) for i in ["full", "partial"]]
+        if self._test_output == "sidecar":
+            output_file_list.append(self._get_test_output_filename(project, version))
+        return output_file_list
+
+
+    def parse_version_i(self, version, project=None, pool=None):
+        if project is None:
+            project = self.project
+        print("processing {} - {}".format(project, version))
+
+        mutant_log_filename, test_log_filename = self._get_input_file_list(project, version)
+        self._stage_timer.start_version("{}_{}".format(project, version))
+
+        with self._stage_timer.stage("parse_test_log"):
+            test_table = self._parse_test_log(test_log_filename)
+
+        if pool is not None:
+            # the chunks reorder their own tests, so reorder is part of this stage
+            with self._stage_timer.stage("parse_mutant_log"):
+                patch_table = self._parse_mutant_log_parallel(mutant_log_filename, pool, test_table)
+        else:
+            with self._stage_timer.stage("parse_mutant_log"):
+                patch_table = self._parse_mutant_log(mutant_log_filename)
+            with self._stage_timer.stage("reorder"):
+                self._change_test_execution_order(patch_table, test_table)
+        self._stage_timer.add_count("patches", len(patch_table))
+
+        output_list = self._get_version_output_list(project, version, patch_table, test_table)
+
+        with self._stage_timer.stage("dump"):
+            for output_filename, result, output_format in output_list:
+                os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+                dump_result(result, output_filename, output_format)
+
+
+    def _get_version_output_list(self, project, version, patch_table, test_table):
+        # (output filename, result, output format) of every file of the version, closes test_table
+        # full and partial matrices come out of one pass, the truncation is part of it
+        with self._stage_timer.stage("merge"):
+            full_result_dict, partial_result_dict, id_method_mapping = self._merge_result(patch_table, test_table)
+            test_dict = test_table.to_dict()
+            test_table.close()
+
+        output_list = []
+        version_result_dict = {
+            "method": id_method_mapping,
+        }
+        if self._test_output == "inline":
+            version_result_dict["test"] = test_dict
+        else:
+            output_list.append((self._get_test_output_filename(project, version), test_dict, "json"))
+
+        full_result = dict(patch=full_result_dict, **version_result_dict)
+        partial_result = dict(patch=partial_result_dict, **version_result_dict)
+        # package/class/statement ids per patch, so rerankers can switch level without string processing
+        with self._stage_timer.stage("entity_index"):
+            add_entity_index([full_result, partial_result])
+
+        output_list.append((self._get_output_filename(project, version, "full"), full_result, self._output_format))
+        output_list.append((self._get_output_filename(project, version, "partial"), partial_result, self._output_format))
+        return output_list
+
+
+    def _read_task(self, task_tuple):
+        # reader stage (thread of the parent): the raw inputs, fingerprinted from the bytes read
+        project, version = task_tuple
+        data_list = []
+        input_info_dict = {}
+        for input_filename in self._get_input_file_list(project, version):
+            with open(input_filename, "rb") as file:
+                data = file.read()
+            data_list.append(data)
+            input_info_dict[os.path.basename(input_filename)] = get_file_info(input_filename, get_data_hash(data))
+
+        return data_list, input_info_dict
+
+
+    def _compute_task(self, task_tuple, input_data):
+        # compute stage (pool worker): parse_version_i on the bytes of _read_task, the outputs
+        # come back encoded, so the writer only has to put them on disk
+        project, version = task_tuple
+        (mutant_log_data, test_log_data), input_info_dict = input_data
+        print("processing {} - {}".format(project, version))
+        start_time = time.time()
+        self._stage_timer.start_version("{}_{}".format(project, version))
+
+        with self._stage_timer.stage("parse_test_log"):
+            test_table = TestTable.from_test_log_bytes(test_log_data)
+        with self._stage_timer.stage("parse_mutant_log"):
+            patch_table = parse_mutant_file(io.BytesIO(mutant_log_data))
+        with self._stage_timer.stage("reorder"):
+            self._change_test_execution_order(patch_table, test_table)
+        self._stage_timer.add_count("patches", len(patch_table))
+
+        output_list = self._get_version_output_list(project, version, patch_table, test_table)
+        with self._stage_timer.stage("encode"):
+            encoded_output_list = [
+                (output_filename, encode_result(result, output_format)) for output_filename, result, output_format in output_list
+            ]
+
+        return encoded_output_list, input_info_dict, time.time() - start_time, self._stage_timer.pop_record_list()
+
+
+    def _write_task(self, task_tuple, compute_output):
+        # writer stage (thread of the parent), returns what _parse_task does
+        project, version = task_tuple
+        encoded_output_list, input_info_dict, task_time, record_list = compute_output
+        for output_filename, data in encoded_output_list:
+            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+            with open(output_filename, "wb") as file:
+                file.write(data)
+
+        return project, version, input_info_dict, task_time, record_list
+
+
+    def _get_task_cost(self, project, version):
+        # parse time grows with the mutant log, its size is a good enough estimate
+        mutant_log_filename, _ = self._get_input_file_list(project, version)
+        return os.path.getsize(mutant_log_filename)
+
+
+    def _parse_task(self, task_tuple):
+        # fingerprint the inputs before parsing them, a later change makes the version stale again
+        project, version = task_tuple
+        input_info_dict = get_input_info(self._get_input_file_list(project, version))
+        start_time = time.time()
+        self.parse_version_i(version, project)
+        return project, version, input_info_dict, time.time() - start_time, self._stage_timer.pop_record_list()
+
+
+    def get_all_task_tuple(self, manifest, force=False):
+        task_tuple_list = []
+        for project in self.project_list:
+            project_dir = os.path.join(self._data_dir, project)
+            version_list = [int(i.replace("_testLog", "")) for i in os.listdir(project_dir) if i.endswith("_testLog")]
+
+            num_stale = 0
+            for version in version_list:
+                input_file_list = self._get_input_file_list(project, version)
+                output_file_list = self._get_all_output_filename(project, version)
+                if force or not manifest.is_fresh("{}_{}".format(project, version), input_file_list, output_file_list):
+                    task_tuple_list.append((project, version))
+                    num_stale += 1
+
+            print("{} - {} of {} versions to parse".format(project, num_stale, len(version_list)))
+
+        # largest first (LPT), so a huge version never starts last while the other cores idle
+        task_tuple_list.sort(key=lambda task_tuple: self._get_task_cost(*task_tuple), reverse=True)
+        return task_tuple_list
+
+
+    def process_all(self, force=False):
+        # versions whose inputs and parser version match the manifest are skipped unless force
+        # the sidecar changes what is written, so it is part of the recorded format
+        manifest_format = self._output_format if self._test_output == "inline" else self._output_format + "+test_sidecar"
+        manifest = ParseManifest(self._output_dir, PARSER_VERSION, manifest_format)
+        task_tuple_list = self.get_all_task_tuple(manifest, force)
+
+        # versions too large for one core are parsed one at a time, with their mutant log split across the pool
+        split_task_tuple_list = [i for i in task_tuple_list if self._get_task_cost(*i) >= self.split_size]
+        task_tuple_list = [i for i in task_tuple_list if self._get_task_cost(*i) < self.split_size]
+
+        start_time = time.time()
+        total_task_time = 0.0
+        max_task_time = 0.0
         pool = multiprocessing.Pool(processes=self.num_cores)
-        result_list = pool.map(self.parse_version_i, version_list)
+
+        # the other versions go to the pool first, so the workers parse them while the parent runs the
+        # serial phases (test log, merge, dump) of the split versions; the executor keeps at most
+        # 2 * num_cores of them queued, so the chunks of a split version only wait for those
+        if self._pipeline:
+            # a few versions read ahead and a few outputs waiting for the writers per core at most
+            pipeline_executor = PipelineExecutor(
+                pool,
+                self._read_task,
+                self._compute_task,
+                self._write_task,
+                max_prefetch=self.num_cores,
+                max_in_flight=2 * self.num_cores,
+                max_pending_write=self.num_cores,
+            )
+        else:
+            # one task per submission: a worker picks the next largest task as soon as it is free
+            pipeline_executor = PipelineExecutor(
+                pool,
+                None,
+                self._parse_task,
+                None,
+                num_readers=1,
+                num_writers=1,
+                max_prefetch=self.num_cores,
+                max_in_flight=2 * self.num_cores,
+                max_pending_write=self.num_cores,
+            )
+        result_iter = pipeline_executor.run(task_tuple_list)
+
+        for project, version in split_task_tuple_list:
+            input_info_dict = get_input_info(self._get_input_file_list(project, version))
+            task_start_time = time.time()
+            self.parse_version_i(version, project, pool)
+            # the parent is busy with it the whole time, the workers only during the chunk parse,
+            # so the ideal makespan below stays a lower bound
+            task_time = time.time() - task_start_time
+            total_task_time += task_time
+            max_task_time = max(max_task_time, task_time)
+            manifest.update("{}_{}".format(project, version), input_info_dict)
+            manifest.save()
+        stage_record_list = self._stage_timer.pop_record_list()
+
+        for project, version, input_info_dict, task_time, record_list in result_iter:
+            stage_record_list.extend(record_list)
+            manifest.update("{}_{}".format(project, version), input_info_dict)
+            manifest.save()
+            total_task_time += task_time
+            max_task_time = max(max_task_time, task_time)
+        pool.close()
+        pool.join()
+
+        # keeps refreshed mtimes of touched but unchanged inputs
+        manifest.save()
+
+        # ideal: perfectly balanced cores, but never shorter than the longest task
+        makespan = time.time() - start_time
+        ideal_makespan = max(total_task_time / self.num_cores, max_task_time)
+        print("--- makespan {:.2f}s, ideal {:.2f}s ({:.0%}) for {} tasks on {} cores ---".format(
+            makespan,
+            ideal_makespan,
+            ideal_makespan / makespan if makespan > 0 else 1.0,
+            len(split_task_tuple_list) + len(task_tuple_list),
+            self.num_cores,
+        ))
+
+        if self._stage_timer.enabled:
+            write_report(stage_record_list, os.path.join(self._output_dir, "instrument_report.json"))
 
 
 if __name__ == "__main__":
     data_dir = "/filesystem/patch_ranking/ProflPartialMatrix/python/data/prapr/data"
     output_dir = "parsed_data"
-    project = "Mockito"
+    project_list = ["Mockito"]
     num_cores = 8
-    pp = PraPRParser(data_dir, output_dir, project, num_cores)
-    pp.process_all()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--force", action="store_true", help="reparse versions that are up to date in the manifest")
+    arg_parser.add_argument("--pipeline", action="store_true", help="prefetch inputs and write outputs in threads while the pool parses")
+    arg_parser.add_argument("--instrument", action="store_true", help="write per-stage timings to <output_dir>/instrument_report.json")
+    args = arg_parser.parse_args()
+
+    pp = PraPRParser(
+        data_dir,
+        output_dir,
+        num_cores=num_cores,
+        project_list=project_list,
+        pipeline=args.pipeline,
+        instrument=args.instrument,
+    )
+    pp.process_all(force=args.force)
 
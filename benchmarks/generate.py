@@ -0,0 +1,170 @@
+import os
+import gzip
+import json
+import random
+from xml.sax.saxutils import escape
+
+
+# deterministic synthetic inputs: the same arguments always give byte-identical files
+
+SEPARATOR = "^^^^^"
+MUTATOR_LIST = [
+    "ReturnValuesMutator",
+    "ConditionalBoundaryMutator",
+    "NegateConditionalsMutator",
+    "FieldNameMutator",
+    "MethodNameMutator",
+]
+# status of a mutation no test killed
+UNKILLED_STATUS_LIST = ["SURVIVED", "SURVIVED", "TIMED_OUT"]
+
+
+def get_method_list(num_methods, rnd):
+    # "<package>.<class>:<method>(<desc>)" like the PraPR mutant logs, a few methods per class
+    method_list = []
+    for method_idx in range(num_methods):
+        clazz = "org.bench.pkg{}.Cls{}".format(method_idx % 7, method_idx % max(1, num_methods // 4))
+        method_list.append("{}:m{}({})V".format(clazz, method_idx, rnd.choice(["", "I", "Ljava/lang/String;"])))
+    return method_list
+
+
+def _get_failing_test_idx_list(num_tests, rnd):
+    return sorted(rnd.sample(range(num_tests), max(1, num_tests // 50)))
+
+
+def _get_patch_tests(num_tests, failing_test_idx_list, rnd, is_plausible):
+    # (executed test idx list, failed test idx list) of one patch
+    failing_test_idx_set = set(failing_test_idx_list)
+    executed_test_idx_list = rnd.sample(range(num_tests), rnd.randint(1, max(1, num_tests // 4)))
+    if is_plausible:
+        # fixes every originally failing test and breaks nothing: PatchCategory.CleanFixFull
+        executed_test_idx_list = failing_test_idx_list + [i for i in executed_test_idx_list if i not in failing_test_idx_set]
+        return executed_test_idx_list, []
+
+    # some patches also run the originally failing tests and fix part of them
+    executed_test_idx_list += [i for i in failing_test_idx_list if i not in executed_test_idx_list and rnd.random() < 0.3]
+    failed_test_idx_list = [
+        i for i in executed_test_idx_list if rnd.random() < (0.7 if i in failing_test_idx_set else 0.1)
+    ]
+    return executed_test_idx_list, failed_test_idx_list
+
+
+def generate_prapr_log(data_dir, project, version, num_patches, num_tests, num_methods, seed=0):
+    # <data_dir>/<project>/<version>_testLog and <version>_mutantlog, see README.md
+    rnd = random.Random(seed)
+    project_dir = os.path.join(data_dir, project)
+    os.makedirs(project_dir, exist_ok=True)
+
+    failing_test_idx_list = _get_failing_test_idx_list(num_tests, rnd)
+    failing_test_idx_set = set(failing_test_idx_list)
+    # test ids are not the line order of the testLog
+    test_id_list = list(range(num_tests))
+    rnd.shuffle(test_id_list)
+
+    with open(os.path.join(project_dir, "{}_testLog".format(version)), "w") as file:
+        for test_idx, test_id in enumerate(test_id_list):
+            test_result = "F" if test_idx in failing_test_idx_set else "P"
+            file.write("org.bench.Test{}.test{} {} {}\n".format(test_idx % 13, test_idx, test_id, test_result))
+
+    method_list = get_method_list(num_methods, rnd)
+    plausible_patch_idx = rnd.randrange(num_patches)
+    with open(os.path.join(project_dir, "{}_mutantlog".format(version)), "w") as file:
+        for patch_idx in range(num_patches):
+            method = rnd.choice(method_list)
+            executed_test_idx_list, failed_test_idx_list = _get_patch_tests(
+                num_tests, failing_test_idx_list, rnd, patch_idx == plausible_patch_idx
+            )
+            file.write(SEPARATOR.join([
+                "{}.java:{}".format(method.split(":")[0].replace(".", "/"), rnd.randint(1, 500)),
+                rnd.choice(MUTATOR_LIST),
+                method,
+                " {} ".format(" ".join(str(test_id_list[i]) for i in executed_test_idx_list)),
+                " {} \n".format(" ".join(str(test_id_list[i]) for i in failed_test_idx_list)),
+            ]))
+
+
+def _get_prapr_test_name(test_idx):
+    return "org.bench.Test{}::test{}".format(test_idx % 13, test_idx)
+
+
+def generate_prapr_report(prapr_dir, version, num_patches, num_tests, num_methods, seed=0):
+    # <prapr_dir>/<version>/pom.xml and <prapr_dir>/<version>/target/prapr-reports/<timestamp>/mutations.xml.gz
+    rnd = random.Random(seed)
+    version_dir = os.path.join(prapr_dir, str(version))
+    report_dir = os.path.join(version_dir, "target", "prapr-reports", "202001010000")
+    os.makedirs(report_dir, exist_ok=True)
+
+    failing_test_idx_list = _get_failing_test_idx_list(num_tests, rnd)
+    with open(os.path.join(version_dir, "pom.xml"), "w") as file:
+        file.write("<project>\n<build>\n<plugins>\n")
+        file.write("<plugin>\n<artifactId>maven-compiler-plugin</artifactId>\n</plugin>\n")
+        file.write("<plugin>\n<artifactId>prapr-plugin</artifactId>\n<configuration>\n<failingTests>\n")
+        for test_idx in failing_test_idx_list:
+            file.write("<failingTest>{}</failingTest>\n".format(_get_prapr_test_name(test_idx)))
+        file.write("</failingTests>\n</configuration>\n</plugin>\n</plugins>\n</build>\n</project>\n")
+
+    def format_tests(test_idx_list):
+        # "<class>.<method>(<class>)" as in the PraPR xml
+        test_name_list = []
+        for test_idx in test_idx_list:
+            test_class, test_method = _get_prapr_test_name(test_idx).split("::")
+            test_name_list.append("{}.{}({})".format(test_class, test_method, test_class))
+        return ", ".join(test_name_list)
+
+    method_list = get_method_list(num_methods, rnd)
+    plausible_patch_idx = rnd.randrange(num_patches)
+    # mtime=0 keeps the gzip header, and so the file, deterministic
+    with gzip.GzipFile(os.path.join(report_dir, "mutations.xml.gz"), "wb", mtime=0) as gz_file:
+        gz_file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<mutations>\n')
+        for patch_idx in range(num_patches):
+            clazz, method = rnd.choice(method_list).split(":")
+            method_name, method_description = method.split("(")
+            executed_test_idx_list, failed_test_idx_list = _get_patch_tests(
+                num_tests, failing_test_idx_list, rnd, patch_idx == plausible_patch_idx
+            )
+            status = "KILLED" if len(failed_test_idx_list) > 0 else rnd.choice(UNKILLED_STATUS_LIST)
+            if patch_idx == plausible_patch_idx:
+                status = "SURVIVED"
+
+            mutation = (
+                "<mutation detected='{}' status='{}' numberOfTestsRun='{}'>"
+                "<sourceFile>{}.java</sourceFile>"
+                "<mutatedClass>{}</mutatedClass>"
+                "<mutatedMethod>{}</mutatedMethod>"
+                "<methodDescription>({}</methodDescription>"
+                "<lineNumber>{}</lineNumber>"
+                "<mutator>org.mudebug.prapr.core.mutationtest.engine.mutators.{}</mutator>"
+                "<index>{}</index>"
+                "<killingTests>{}</killingTests>"
+                "<coveringTests>{}</coveringTests>"
+                "<description>{}</description>"
+                "</mutation>\n"
+            ).format(
+                "true" if status == "KILLED" else "false",
+                status,
+                len(executed_test_idx_list),
+                clazz.split(".")[-1],
+                clazz,
+                method_name,
+                method_description,
+                rnd.randint(1, 500),
+                rnd.choice(MUTATOR_LIST),
+                patch_idx,
+                format_tests(failed_test_idx_list),
+                format_tests(executed_test_idx_list),
+                escape("replaced return value with <synthetic> & friends {}".format(patch_idx)),
+            )
+            gz_file.write(mutation.encode("utf-8"))
+        gz_file.write(b"</mutations>\n")
+
+
+def generate_rerank_result(eval_dir, num_results, seed=0):
+    # <eval_dir>/<project>_<version>.json as written by the rerankers, for make_table
+    rnd = random.Random(seed)
+    os.makedirs(eval_dir, exist_ok=True)
+
+    for result_idx in range(num_results):
+        project = "Proj{}".format(result_idx % 5)
+        gt = rnd.randint(1, 2000)
+        with open(os.path.join(eval_dir, "{}_{}.json".format(project, result_idx)), "w") as json_file:
+            json.dump({"gt": gt, "eval": rnd.randint(1, 2 * gt)}, json_file, indent=4)
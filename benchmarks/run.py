@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import functools
+import tempfile
+import contextlib
+
+# the parsers and rerankers are top-level scripts of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate import generate_prapr_log, generate_prapr_report, generate_rerank_result
+
+
+SIZE_DICT = {
+    "small": {"num_patches": 1000, "num_tests": 200, "num_methods": 50},
+    "medium": {"num_patches": 10000, "num_tests": 1000, "num_methods": 300},
+    "large": {"num_patches": 50000, "num_tests": 3000, "num_methods": 1500},
+}
+PROJECT = "Bench"
+VERSION = 1
+
+
+def time_call(func, repeat):
+    # wall time of each call, the progress prints of the scripts are dropped
+    time_list = []
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start_time = time.perf_counter()
+            func()
+            time_list.append(time.perf_counter() - start_time)
+
+    return time_list
+
+
+def _generate_parsed_data(work_dir, size):
+    from PraPR_parser_v1 import PraPRParser
+
+    data_dir = os.path.join(work_dir, "prapr_log")
+    parsed_dir = os.path.join(work_dir, "parsed")
+    generate_prapr_log(data_dir, PROJECT, VERSION, **size)
+
+    parser = PraPRParser(data_dir, parsed_dir, [PROJECT])
+    return parser, parsed_dir
+
+
+def bench_parse_version(work_dir, size, repeat):
+    parser, _ = _generate_parsed_data(work_dir, size)
+    return time_call(lambda: parser.parse_version_i(PROJECT, VERSION), repeat)
+
+
+def bench_process_all(work_dir, size, repeat, pipeline=False, num_versions=8, num_cores=2):
+    # whole-project throughput of the multi-core parser, with and without the pipelined executor
+    from PraPR_parser_v1_multi_core import PraPRParser
+
+    data_dir = os.path.join(work_dir, "prapr_log")
+    for version in range(1, num_versions + 1):
+        generate_prapr_log(data_dir, PROJECT, version, **size)
+
+    parser = PraPRParser(data_dir, os.path.join(work_dir, "parsed"), project_list=[PROJECT], num_cores=num_cores, pipeline=pipeline)
+    return time_call(lambda: parser.process_all(force=True), repeat)
+
+
+def bench_parse_mutant_log(work_dir, size, repeat):
+    from mutant_log import parse_mutant_log
+
+    data_dir = os.path.join(work_dir, "prapr_log")
+    generate_prapr_log(data_dir, PROJECT, VERSION, **size)
+    return time_call(lambda: parse_mutant_log(os.path.join(data_dir, PROJECT, "{}_mutantlog".format(VERSION))), repeat)
+
+
+def bench_lingming_run_project(work_dir, size, repeat):
+    from prapr_lingming import PraprParser
+
+    prapr_dir = os.path.join(work_dir, "prapr_report")
+    generate_prapr_report(prapr_dir, VERSION, **size)
+
+    parser = PraprParser(prapr_dir, os.path.join(work_dir, "lingming"))
+    return time_call(lambda: parser._run_project(VERSION), repeat)
+
+
+def bench_jit_patch_rerank(work_dir, size, repeat):
+    from patch_rerank_sam_approach_prapr_v0 import PatchRerankerSamApproach
+
+    parser, parsed_dir = _generate_parsed_data(work_dir, size)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        parser.parse_version_i(PROJECT, VERSION)
+
+    reranker = PatchRerankerSamApproach(parsed_dir, os.path.join(work_dir, "eval"), matrix_type="partial", num_threads=1)
+    return time_call(lambda: reranker.jit_patch_rerank((PROJECT, VERSION)), repeat)
+
+
+def bench_get_table(work_dir, size, repeat):
+    from make_table import get_table
+
+    # one rerank result per 10 patches, so the table grows with the size like the others
+    eval_dir = os.path.join(work_dir, "eval_table")
+    generate_rerank_result(eval_dir, size["num_patches"] // 10)
+    return time_call(lambda: get_table(eval_dir), repeat)
+
+
+BENCHMARK_DICT = {
+    "PraPRParser.parse_version_i": bench_parse_version,
+    "PraPRParser.process_all": bench_process_all,
+    "PraPRParser.process_all[pipeline]": functools.partial(bench_process_all, pipeline=True),
+    "mutant_log.parse_mutant_log": bench_parse_mutant_log,
+    "PraprParser._run_project": bench_lingming_run_project,
+    "PatchRerankerSamApproach.jit_patch_rerank": bench_jit_patch_rerank,
+    "make_table.get_table": bench_get_table,
+}
+
+
+def run_benchmark(benchmark_list, size_list, repeat):
+    result_list = []
+    for size_name in size_list:
+        size = SIZE_DICT[size_name]
+        for benchmark in benchmark_list:
+            print("running {} - {}".format(benchmark, size_name))
+            result = {"benchmark": benchmark, "size": size_name}
+            result.update(size)
+
+            with tempfile.TemporaryDirectory() as work_dir:
+                try:
+                    time_list = BENCHMARK_DICT[benchmark](work_dir, size, repeat)
+                except Exception as e:
+                    # e.g. a missing dependency of one script, the other benchmarks still run
+                    print("   failed: {!r}".format(e))
+                    result["error"] = repr(e)
+                    result_list.append(result)
+                    continue
+
+            result["times"] = time_list
+            result["min"] = min(time_list)
+            result["mean"] = sum(time_list) / len(time_list)
+            print("   min {:.4f}s, mean {:.4f}s".format(result["min"], result["mean"]))
+            result_list.append(result)
+
+    return result_list
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=sorted(SIZE_DICT.keys()))
+    arg_parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARK_DICT.keys()), choices=list(BENCHMARK_DICT.keys()))
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--output", default="benchmark_result.json")
+    args = arg_parser.parse_args()
+
+    result_list = run_benchmark(args.benchmarks, args.sizes, args.repeat)
+
+    with open(args.output, "w") as json_file:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "results": result_list,
+        }, json_file, indent=4)
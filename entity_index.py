@@ -0,0 +1,58 @@
+def get_method_class(method):
+    # "<class>:<method>(<desc>)" in the PraPR mutant logs,
+    # "<class>.<method>(<desc>)" in the reports prapr_lingming parses
+    if ":" in method:
+        return method.split(":")[0]
+    return method.split("(")[0].rsplit(".", 1)[0]
+
+
+def get_class_package(clazz):
+    return ".".join(clazz.split(".")[:-1])
+
+
+def _get_entity_id(entity_id_dict, entity):
+    if entity not in entity_id_dict:
+        entity_id_dict[entity] = len(entity_id_dict)
+    return entity_id_dict[entity]
+
+
+def add_entity_index(result_list):
+    # result_list: the parsed results of one version (e.g. full and partial), sharing patch ids
+    # and the "method" table. Every patch gets integer "package", "class" and "statement" ids
+    # next to "method", and each level gets an id -> name table, ids in order of first appearance
+    method_mapping = result_list[0]["method"]
+    package_id_dict = {}
+    class_id_dict = {}
+    statement_id_dict = {}
+
+    # method id -> (package id, class id)
+    method_entity_dict = {}
+    for method_id, method in method_mapping.items():
+        clazz = get_method_class(method)
+        method_entity_dict[method_id] = (
+            _get_entity_id(package_id_dict, get_class_package(clazz)),
+            _get_entity_id(class_id_dict, clazz),
+        )
+
+    for patch_id, patch_data in result_list[0]["patch"].items():
+        method_id = patch_data["method"]
+        package_id, class_id = method_entity_dict[method_id]
+        statement_id = _get_entity_id(statement_id_dict, (method_id, patch_data["line"]))
+
+        for result in result_list:
+            result["patch"][patch_id].update({
+                "package": package_id,
+                "class": class_id,
+                "statement": statement_id,
+            })
+
+    entity_table_dict = {
+        "package": {entity_id: package for package, entity_id in package_id_dict.items()},
+        "class": {entity_id: clazz for clazz, entity_id in class_id_dict.items()},
+        "statement": {
+            entity_id: "{}_{}".format(method_mapping[method_id], line)
+            for (method_id, line), entity_id in statement_id_dict.items()
+        },
+    }
+    for result in result_list:
+        result.update(entity_table_dict)
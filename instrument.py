@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak rss is then reported as None
+    resource = None
+
+
+def get_peak_rss_mb():
+    # peak resident set size of this process so far (linux: KB, macOS: bytes)
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss / float(1 << 20)
+    return peak_rss / 1024.0
+
+
+class StageTimer:
+    # opt-in per-stage wall time, cpu time and peak rss, one record per version
+    # records stay in the process that made them: pool workers hand them back through
+    # pop_record_list() and the parent merges them with summarize_record_list()
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._record_list = []
+        self._record = None
+
+
+    def __getstate__(self):
+        # a copy sent to a pool worker (with a bound method of its owner) starts without records:
+        # the records of the parent, possibly being filled meanwhile, are neither pickled nor sent back
+        return {"enabled": self.enabled}
+
+
+    def __setstate__(self, state):
+        self.__init__(state["enabled"])
+
+
+    def start_version(self, key):
+        if not self.enabled:
+            return
+
+        self._record = {
+            "key": key,
+            "pid": os.getpid(),
+            "stages": {},
+            "counts": {},
+        }
+        self._record_list.append(self._record)
+
+
+    @contextlib.contextmanager
+    def stage(self, stage_name):
+        if not self.enabled or self._record is None:
+            yield
+            return
+
+        start_wall_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        try:
+            yield
+        finally:
+            stage_dict = self._record["stages"]
+            if stage_name not in stage_dict:
+                stage_dict[stage_name] = {"wall": 0.0, "cpu": 0.0}
+            stage_dict[stage_name]["wall"] += time.perf_counter() - start_wall_time
+            stage_dict[stage_name]["cpu"] += time.process_time() - start_cpu_time
+            # process peak so far, the stage that raised it is the first one showing the new value
+            stage_dict[stage_name]["peak_rss_mb"] = get_peak_rss_mb()
+
+
+    def add_count(self, name, value):
+        if not self.enabled or self._record is None:
+            return
+
+        self._record["counts"][name] = self._record["counts"].get(name, 0) + value
+
+
+    def pop_record_list(self):
+        record_list = self._record_list
+        self._record_list = []
+        self._record = None
+        return record_list
+
+
+def summarize_record_list(record_list, num_slowest=10):
+    # per stage totals over all versions and workers, plus the slowest versions
+    stage_summary_dict = {}
+    for record in record_list:
+        for stage_name, stage_info in record["stages"].items():
+            if stage_name not in stage_summary_dict:
+                stage_summary_dict[stage_name] = {
+                    "count": 0,
+                    "total_wall": 0.0,
+                    "total_cpu": 0.0,
+                    "max_wall": 0.0,
+                    "max_wall_key": None,
+                    "max_peak_rss_mb": None,
+                }
+            stage_summary = stage_summary_dict[stage_name]
+            stage_summary["count"] += 1
+            stage_summary["total_wall"] += stage_info["wall"]
+            stage_summary["total_cpu"] += stage_info["cpu"]
+            if stage_info["wall"] >= stage_summary["max_wall"]:
+                stage_summary["max_wall"] = stage_info["wall"]
+                stage_summary["max_wall_key"] = record["key"]
+            if stage_info["peak_rss_mb"] is not None:
+                stage_summary["max_peak_rss_mb"] = max(stage_summary["max_peak_rss_mb"] or 0.0, stage_info["peak_rss_mb"])
+
+    for stage_summary in stage_summary_dict.values():
+        stage_summary["mean_wall"] = stage_summary["total_wall"] / stage_summary["count"]
+
+    version_list = []
+    for record in record_list:
+        version_list.append({
+            "key": record["key"],
+            "pid": record["pid"],
+            "wall": sum(stage_info["wall"] for stage_info in record["stages"].values()),
+            "cpu": sum(stage_info["cpu"] for stage_info in record["stages"].values()),
+            "counts": record["counts"],
+        })
+    version_list.sort(key=lambda version_info: version_info["wall"], reverse=True)
+
+    return {
+        "num_versions": len(record_list),
+        "num_workers": len(set(record["pid"] for record in record_list)),
+        "stages": stage_summary_dict,
+        "slowest_versions": version_list[:num_slowest],
+    }
+
+
+def write_report(record_list, filename):
+    summary = summarize_record_list(record_list)
+
+    print("--- {} versions on {} workers ---".format(summary["num_versions"], summary["num_workers"]))
+    for stage_name, stage_summary in summary["stages"].items():
+        print("   {}: total {:.2f}s wall / {:.2f}s cpu, max {:.2f}s ({})".format(
+            stage_name,
+            stage_summary["total_wall"],
+            stage_summary["total_cpu"],
+            stage_summary["max_wall"],
+            stage_summary["max_wall_key"],
+        ))
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w") as json_file:
+        json.dump({"summary": summary, "records": record_list}, json_file, indent=4)
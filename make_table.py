@@ -1,47 +1,142 @@
 import os
-import json
+import multiprocessing
+from result_store import ResultStore
+from version_matrix import JsonSectionReader
+from rerank_config import SAM_APPROACH_V0_RERANKER, build_store_config
 from pprint import pprint
 
 
-def get_table(data_path):
+def iter_json_result(data_path, section_name_list=("gt", "eval", "censored"), formula=None):
+    # (project, version, rerank result) of every <project>_<version>.json in data_path,
+    # only the given sections are parsed (when the file has them), visited_patch_id_list is skipped
+    # formula: the result of a formula_list run is {formula: {"gt", "eval"}}, only that formula is parsed
+    if formula is not None:
+        section_name_list = (formula,)
+
+    with os.scandir(data_path) as entry_iter:
+        for entry in entry_iter:
+            if not entry.name.endswith(".json"):
+                continue
+
+            project, version = entry.name[:-len(".json")].split("_")
+            reader = JsonSectionReader(entry.path)
+            rerank_data = {name: reader.get_section(name) for name in section_name_list if reader.has_section(name)}
+            reader.close()
+            yield project, version, rerank_data
+
+
+def get_improvement_ratio(total_gt, total_eval):
+    # None when a project has no ground truth rank to improve on
+    if total_gt == 0:
+        return None
+
+    return (total_gt - total_eval) / total_gt
+
+
+def sum_result(result_iter, verbose=False, formula=None):
+    # running totals per project, one pass over the results
+    # a censored result (max_trials reached before the fix) has no exact eval, it is only counted
+    # formula: the formula to sum of results of a formula_list run
     result_dict = {
         "Overall": {
             "total_gt": 0,
-            "total_eval": 0
+            "total_eval": 0,
+            "num_censored": 0
         }
     }
-    word_list = [i.replace(".json", "") for i in os.listdir(data_path) if i.endswith(".json")]
-    for word in word_list:
-        project, version = word.split("_")
-        json_filename = os.path.join(data_path, "{}.json".format(word))
-
-        with open(json_filename) as file:
-            rerank_data = json.load(file)
-
-        print("{} - {}".format(project, version))
-        print("   gt: " + str(rerank_data["gt"]))
-        print("   eval: " + str(rerank_data["eval"]))
+    for project, version, rerank_data in result_iter:
+        if formula is not None:
+            rerank_data = rerank_data[formula]
+
+        if verbose:
+            print("{} - {}".format(project, version))
+            print("   gt: " + str(rerank_data["gt"]))
+            print("   eval: " + str(rerank_data["eval"]))
         
         if project not in result_dict:
             result_dict[project] = {
                 "total_gt": 0,
-                "total_eval": 0
+                "total_eval": 0,
+                "num_censored": 0
             }
+
+        if rerank_data.get("censored", False):
+            result_dict[project]["num_censored"] += 1
+            result_dict["Overall"]["num_censored"] += 1
+            continue
+
         result_dict[project]["total_gt"] += rerank_data["gt"]
         result_dict[project]["total_eval"] += rerank_data["eval"]
 
         result_dict["Overall"]["total_gt"] += rerank_data["gt"]
         result_dict["Overall"]["total_eval"] += rerank_data["eval"]
 
-        for project, proj_data in result_dict.items():
-            a = proj_data["total_gt"]
-            b = proj_data["total_eval"]
-            improvement = (a - b) / a
-            proj_data["imprv_ratio"] = improvement
+    return result_dict
+
+
+def add_improvement_ratio(result_dict):
+    for project, proj_data in result_dict.items():
+        proj_data["imprv_ratio"] = get_improvement_ratio(proj_data["total_gt"], proj_data["total_eval"])
 
     return result_dict
 
 
+def get_table(data_path, verbose=True, formula=None):
+    return add_improvement_ratio(sum_result(iter_json_result(data_path, formula=formula), verbose, formula))
+
+
+def _sum_data_path(task):
+    data_path, result_iter_func, formula = task
+    if formula is None:
+        return data_path, sum_result(result_iter_func(data_path))
+
+    return data_path, sum_result(result_iter_func(data_path, formula=formula), formula=formula)
+
+
+def build_table(data_path_list, num_threads=8, result_iter_func=iter_json_result, formula=None):
+    # data_path -> get_table(data_path), every eval directory is summed by its own worker
+    # and the ratios are computed once, after all results are in
+    # result_iter_func(data_path) yields (project, version, rerank result), whatever the results are stored in,
+    # with a formula (see get_table) it is called as result_iter_func(data_path, formula=formula)
+    pool = multiprocessing.Pool(processes=max(1, min(num_threads, len(data_path_list))))
+    sum_dict = dict(pool.imap_unordered(
+        _sum_data_path, [(data_path, result_iter_func, formula) for data_path in data_path_list]
+    ))
+    pool.close()
+    pool.join()
+
+    return {data_path: add_improvement_ratio(sum_dict[data_path]) for data_path in data_path_list}
+
+
+def build_store_table(store_dir, row_config_dict, formula=None):
+    # row -> get_table() of the results stored under exactly row_config_dict[row], one scan of the store for all rows
+    # a row config is the get_store_config() of the reranker that wrote the row, or rerank_config.build_store_config()
+    # the store keeps the latest result per (project, version, config), so a row counts every version once
+    # formula: the formula to tabulate of formula_list runs, one call per formula gives per-formula tables
+    row_result_dict = {row: [] for row in row_config_dict}
+    for record in ResultStore(store_dir).iter_record():
+        for row, row_config in row_config_dict.items():
+            if record["config"] == row_config:
+                row_result_dict[row].append((record["project"], record["version"], record["result"]))
+
+    return {row: add_improvement_ratio(sum_result(row_result_dict[row], formula=formula)) for row in row_config_dict}
+
+
+def write_table(table_dict, filename):
+    # one row per data path, the columns are the projects of the first one
+    with open(filename, "w") as file:
+        first_line_wrote = False
+
+        for data_path, result in table_dict.items():
+            project_list = sorted(result.keys())
+            if not first_line_wrote:
+                file.write(",{}\n".format(",".join(project_list)))
+                first_line_wrote = True
+
+            improvement_list = ["" if result[i]["imprv_ratio"] is None else str(result[i]["imprv_ratio"]) for i in project_list]
+            file.write("{},{}\n".format(data_path, ",".join(improvement_list)))
+
+
 # with open("table.csv", "w") as file:
 #     first_line_wrote = False
 
@@ -62,9 +157,7 @@ def get_table(data_path):
 #         file.write("{},{}\n".format(data_path, ",".join(improvement_list)))
 
 
-with open("table_3.csv", "w") as file:
-    first_line_wrote = False
-
+if __name__ == "__main__":
     # for data_path in [
     #     "eval/full",
     #     "eval/partial",
@@ -72,7 +165,7 @@ with open("table_3.csv", "w") as file:
     #     "eval_nononfix/partial",
     # ]:
 
-    for data_path in [
+    data_path_list = [
         # "eval_no_closure_class_nononfix/partial",
         # "eval_no_closure_method_nononfix/partial",
         # "eval_no_closure_package_nononfix/partial",
@@ -103,15 +196,21 @@ with open("table_3.csv", "w") as file:
         "eval_class/full",
         "eval_method/full",
         "eval_statement/full"
-    ]:
-        result = get_table(data_path)
-        # break
-
-        project_list = sorted(result.keys())
-        if not first_line_wrote:
-            file.write(",{}\n".format(",".join(project_list)))
-            first_line_wrote = True
-
-        improvement_list = [str(result[i]["imprv_ratio"]) for i in project_list]
-        file.write("{},{}\n".format(data_path, ",".join(improvement_list)))
+    ]
+
+    # results store written by the rerankers (result_store_dir), the eval directories otherwise
+    result_store_dir = "rerank_results"
+    if os.path.isdir(result_store_dir):
+        # the configurations of the default sweep behind the eval directories, see PatchRerankerSweep
+        row_config_dict = {
+            "eval_{}/{}".format(modified_entity_level, matrix_type): build_store_config(
+                SAM_APPROACH_V0_RERANKER, "Ochiai", matrix_type, modified_entity_level, False
+            )
+            for matrix_type in ["partial", "full"]
+            for modified_entity_level in ["package", "class", "method", "statement"]
+        }
+        table_dict = build_store_table(result_store_dir, row_config_dict)
+    else:
+        table_dict = build_table(data_path_list)
 
+    write_table(table_dict, "table_3.csv")
@@ -0,0 +1,242 @@
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+
+# binary columnar layout of one parsed version (little endian):
+#   magic (8 bytes) | header length (uint64) | header (utf-8 json, padded to 8 bytes) | columns
+# the header keeps every table that is stored once (method, test, ...), the number of
+# patches and, for each per-patch field, the byte offset of its int32 column
+# string fields (e.g. patch_category) are stored as an int32 code column plus a string table
+MAGIC = b"PRPRMAT1"
+OUTPUT_FORMAT_EXTENSION_DICT = {
+    "json": ".json",
+    "binary": ".bin",
+}
+COLUMN_TYPECODE = "i"
+
+
+def get_output_extension(output_format):
+    assert output_format in OUTPUT_FORMAT_EXTENSION_DICT, "unknown output format {}".format(output_format)
+    return OUTPUT_FORMAT_EXTENSION_DICT[output_format]
+
+
+def _to_little_endian(column):
+    if sys.byteorder == "big":
+        column = array(COLUMN_TYPECODE, column)
+        column.byteswap()
+    return column
+
+
+def encode_string_column(value_list):
+    # (int32 code column, string table), codes in order of first appearance
+    string_code_dict = {}
+    code_column = array(COLUMN_TYPECODE)
+    for value in value_list:
+        if value not in string_code_dict:
+            string_code_dict[value] = len(string_code_dict)
+        code_column.append(string_code_dict[value])
+
+    return code_column, list(string_code_dict.keys())
+
+
+def encode_binary_matrix(result):
+    # result: {"patch": {patch_id: {field: int or str}}, <table name>: <json serializable table>, ...}
+    patch_dict = result["patch"]
+    patch_id_list = list(patch_dict.keys())
+    field_list = list(patch_dict[patch_id_list[0]].keys()) if len(patch_id_list) > 0 else []
+
+    column_list = [("patch_id", None, array(COLUMN_TYPECODE, [int(i) for i in patch_id_list]))]
+    for field in field_list:
+        value_list = [patch_dict[patch_id][field] for patch_id in patch_id_list]
+        if all(type(value) == int for value in value_list):
+            column_list.append((field, None, array(COLUMN_TYPECODE, value_list)))
+            continue
+
+        code_column, string_table = encode_string_column(value_list)
+        column_list.append((field, string_table, code_column))
+
+    column_size = len(patch_id_list) * array(COLUMN_TYPECODE).itemsize
+    column_header_list = []
+    for idx, (field, string_table, _) in enumerate(column_list):
+        column_header = {"name": field, "offset": idx * column_size}
+        if string_table is not None:
+            column_header["table"] = string_table
+        column_header_list.append(column_header)
+
+    header = {
+        "num_patch": len(patch_id_list),
+        "columns": column_header_list,
+        "tables": {key: value for key, value in result.items() if key != "patch"},
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    return b"".join(
+        [MAGIC, struct.pack("<Q", len(header_bytes)), header_bytes]
+        + [_to_little_endian(column).tobytes() for _, _, column in column_list]
+    )
+
+
+def write_binary_matrix(filename, result):
+    with open(filename, "wb") as file:
+        file.write(encode_binary_matrix(result))
+
+
+def _read_header(file):
+    magic = file.read(len(MAGIC))
+    assert magic == MAGIC, "not a binary matrix file"
+    header_len = struct.unpack("<Q", file.read(8))[0]
+    header = json.loads(file.read(header_len).decode("utf-8"))
+    return header, len(MAGIC) + 8 + header_len
+
+
+def read_binary_matrix(filename):
+    # returns the same structure json.load gives for the json output
+    with open(filename, "rb") as file:
+        header, data_offset = _read_header(file)
+        column_size = header["num_patch"] * array(COLUMN_TYPECODE).itemsize
+
+        column_dict = {}
+        for column_header in header["columns"]:
+            file.seek(data_offset + column_header["offset"])
+            column = array(COLUMN_TYPECODE)
+            column.frombytes(file.read(column_size))
+            column = _to_little_endian(column)
+            if "table" in column_header:
+                column = [column_header["table"][code] for code in column]
+            column_dict[column_header["name"]] = column
+
+    field_list = [column_header["name"] for column_header in header["columns"][1:]]
+    patch_dict = {}
+    for idx, patch_id in enumerate(column_dict["patch_id"]):
+        patch_dict[str(patch_id)] = {field: column_dict[field][idx] for field in field_list}
+
+    result = {"patch": patch_dict}
+    result.update(header["tables"])
+    return result
+
+
+def dump_result(result, filename, output_format="json"):
+    if output_format == "binary":
+        write_binary_matrix(filename, result)
+        return
+
+    with open(filename, 'w') as json_file:
+        json.dump(result, json_file, indent=4)
+
+
+def encode_result(result, output_format="json"):
+    # the bytes dump_result writes, for writing them later or from another process
+    if output_format == "binary":
+        return encode_binary_matrix(result)
+
+    return json.dumps(result, indent=4).encode("utf-8")
+
+
+def load_result(filename, data_format="json"):
+    if data_format == "binary":
+        return read_binary_matrix(filename)
+
+    with open(filename) as file:
+        return json.load(file)
+
+
+class StringColumn:
+    # read-only view of a string column: int32 codes + string table, nothing is decoded up front
+    def __init__(self, code_column, string_table):
+        self._code_column = code_column
+        self._string_table = string_table
+
+
+    def __len__(self):
+        return len(self._code_column)
+
+
+    def __getitem__(self, idx):
+        return self._string_table[self._code_column[idx]]
+
+
+    def __iter__(self):
+        for code in self._code_column:
+            yield self._string_table[code]
+
+
+    def __contains__(self, value):
+        if value not in self._string_table:
+            return False
+        return self._string_table.index(value) in self._code_column
+
+
+class MappedMatrix:
+    # memory-mapped binary matrix, columns are zero-copy int32 views of the page cache
+    # so every worker process reading the same version shares one copy
+    def __init__(self, filename):
+        assert sys.byteorder == "little", "zero-copy columns need a little endian host, use read_binary_matrix"
+
+        self._file = open(filename, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        header_len = struct.unpack_from("<Q", self._mmap, len(MAGIC))[0]
+        assert self._mmap[:len(MAGIC)] == MAGIC, "not a binary matrix file"
+        data_offset = len(MAGIC) + 8
+        self._header = json.loads(bytes(self._buffer[data_offset:data_offset + header_len]).decode("utf-8"))
+        self._data_offset = data_offset + header_len
+        self._column_header_dict = {column_header["name"]: column_header for column_header in self._header["columns"]}
+
+
+    def __len__(self):
+        return self._header["num_patch"]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def get_table(self, name):
+        return self._header["tables"][name]
+
+
+    def has_table(self, name):
+        return name in self._header["tables"]
+
+
+    def get_column_name_list(self):
+        return [column_header["name"] for column_header in self._header["columns"]]
+
+
+    def has_column(self, name):
+        return name in self._column_header_dict
+
+
+    def get_column(self, name):
+        if name not in self._column_header_dict and self._header["num_patch"] == 0:
+            # a version without patches has no patch to take the fields from, so its file has no
+            # columns besides patch_id; every column is empty, as in the json output
+            return array(COLUMN_TYPECODE)
+
+        column_header = self._column_header_dict[name]
+        start = self._data_offset + column_header["offset"]
+        column_size = self._header["num_patch"] * array(COLUMN_TYPECODE).itemsize
+        column = self._buffer[start:start + column_size].cast(COLUMN_TYPECODE)
+
+        if "table" in column_header:
+            return StringColumn(column, column_header["table"])
+        return column
+
+
+    def close(self):
+        self._buffer.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # columns handed out by get_column are still alive, the mapping goes away with them
+            pass
+        self._file.close()
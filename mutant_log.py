@@ -0,0 +1,169 @@
+import io
+from array import array
+from patch_record import INT_TYPECODE, IntListColumn, PatchTable
+
+try:
+    import numpy as np
+except ImportError:
+    # the test ids are then converted with array(INT_TYPECODE, map(int, ...)), same records
+    np = None
+
+
+# bulk tokenizer of the PraPR mutant logs: "<file>:<line>^^^^^<mutator>^^^^^<method>^^^^^ <tests> ^^^^^ <failed> \n"
+# the log is read in large binary blocks cut at line ends, the test id fields of a whole block
+# are converted at once instead of one int() per token
+
+SEPARATOR = b"^^^^^"
+BLOCK_SIZE = 16 << 20
+# largest (row, test id) flag table of a block, sorted keys are searched above it
+MAX_KEY_TABLE_SIZE = 64 << 20
+
+
+def _normalize_newlines(block):
+    # "\r\n" and "\r" end lines like "\n", as for open(filename) in text mode
+    if b"\r" not in block:
+        return block
+    return block.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def iter_block(file, block_size=BLOCK_SIZE):
+    # blocks of whole lines, only the last one may lack its "\n"
+    rest = b""
+    while True:
+        data = file.read(block_size)
+        if len(data) == 0:
+            break
+
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            rest = data
+            continue
+
+        rest = data[end:]
+        yield _normalize_newlines(data[:end])
+
+    if len(rest) > 0:
+        yield _normalize_newlines(rest)
+
+
+def _parse_int_field_list(field_list):
+    # whitespace separated ints of every field -> (offset column, value column) of an IntListColumn
+    if np is None:
+        offset_column = array(INT_TYPECODE, [0])
+        value_column = array(INT_TYPECODE)
+        for field in field_list:
+            value_column.extend(map(int, field.split()))
+            offset_column.append(len(value_column))
+        return offset_column, value_column
+
+    data = b" ".join(field_list)
+    # a token starts at every non-whitespace byte that follows whitespace
+    is_token_array = np.frombuffer(b" " + data, dtype=np.uint8) > 32
+    token_start_array = np.flatnonzero(is_token_array[1:] & ~is_token_array[:-1])
+
+    field_end_array = np.cumsum([len(field) + 1 for field in field_list])
+    offset_array = np.concatenate(([0], np.searchsorted(token_start_array, field_end_array)))
+
+    value_array = np.fromstring(data, dtype=np.int32, sep=" ") if len(token_start_array) > 0 else np.zeros(0, np.int32)
+    if len(value_array) != len(token_start_array):
+        raise ValueError("invalid test id in mutant log")
+
+    return array(INT_TYPECODE, offset_array.astype(np.int32).tobytes()), array(INT_TYPECODE, value_array.tobytes())
+
+
+def _get_ordered_failed_column(test_execution_column, failed_offset_column, failed_value_column):
+    # failed tests of a patch in its execution order, tests executed twice are listed twice
+    ordered_failed_column = IntListColumn()
+    if np is None:
+        for row, test_execution_list in enumerate(test_execution_column):
+            failed_test_set = set(failed_value_column[failed_offset_column[row]:failed_offset_column[row + 1]])
+            ordered_failed_column.append([test_i for test_i in test_execution_list if test_i in failed_test_set])
+        return ordered_failed_column
+
+    num_rows = len(test_execution_column)
+    test_execution_array = np.frombuffer(test_execution_column.value_column, dtype=np.int32).astype(np.int64)
+    failed_array = np.frombuffer(failed_value_column, dtype=np.int32).astype(np.int64)
+    if len(failed_array) == 0:
+        ordered_failed_column.offset_column = array(INT_TYPECODE, [0] * (num_rows + 1))
+        return ordered_failed_column
+
+    # (row, test id) keys, so one lookup covers all patches of the block
+    min_test_id = min(test_execution_array.min(initial=0), failed_array.min())
+    key_base = max(test_execution_array.max(initial=0), failed_array.max()) - min_test_id + 1
+    execution_row_array = np.repeat(np.arange(num_rows), np.diff(np.frombuffer(test_execution_column.offset_column, dtype=np.int32)))
+    failed_row_array = np.repeat(np.arange(num_rows), np.diff(np.frombuffer(failed_offset_column, dtype=np.int32)))
+    execution_key_array = execution_row_array * key_base + test_execution_array - min_test_id
+    failed_key_array = failed_row_array * key_base + failed_array - min_test_id
+
+    if num_rows * key_base <= MAX_KEY_TABLE_SIZE:
+        # one flag per possible key
+        is_failed_key_array = np.zeros(num_rows * key_base, dtype=bool)
+        is_failed_key_array[failed_key_array] = True
+        is_failed_array = is_failed_key_array[execution_key_array]
+    else:
+        failed_key_array = np.sort(failed_key_array)
+        key_idx_array = np.minimum(np.searchsorted(failed_key_array, execution_key_array), len(failed_key_array) - 1)
+        is_failed_array = failed_key_array[key_idx_array] == execution_key_array
+
+    offset_array = np.concatenate(([0], np.cumsum(np.bincount(execution_row_array[is_failed_array], minlength=num_rows))))
+    ordered_failed_column.offset_column = array(INT_TYPECODE, offset_array.astype(np.int32).tobytes())
+    ordered_failed_column.value_column = array(INT_TYPECODE, test_execution_array[is_failed_array].astype(np.int32).tobytes())
+    return ordered_failed_column
+
+
+def parse_mutant_block(block):
+    # PatchTable of the lines of one block, the same records as parsing them line by line
+    method_column = array(INT_TYPECODE)
+    method_table = []
+    method_code_dict = {}
+    line_column = array(INT_TYPECODE)
+    test_execution_field_list = []
+    failed_test_field_list = []
+
+    for line in block.split(b"\n"):
+        if SEPARATOR not in line:
+            continue
+
+        tag, mutator, method, test_execution_field, failed_test_field = line.split(SEPARATOR)
+        line_column.append(int(tag[tag.rfind(b":") + 1:]))
+
+        method_code = method_code_dict.get(method)
+        if method_code is None:
+            method_code = len(method_table)
+            method_code_dict[method] = method_code
+            method_table.append(method.decode("utf-8"))
+        method_column.append(method_code)
+
+        test_execution_field_list.append(test_execution_field)
+        failed_test_field_list.append(failed_test_field)
+
+    test_execution_column = IntListColumn()
+    test_execution_column.offset_column, test_execution_column.value_column = _parse_int_field_list(test_execution_field_list)
+    failed_offset_column, failed_value_column = _parse_int_field_list(failed_test_field_list)
+
+    return PatchTable.from_columns(
+        method_table,
+        method_column,
+        line_column,
+        test_execution_column,
+        _get_ordered_failed_column(test_execution_column, failed_offset_column, failed_value_column),
+    )
+
+
+def parse_mutant_file(file, block_size=BLOCK_SIZE):
+    # file opened in binary mode, blocks are concatenated in file order like PatchTable.extend does for chunks
+    patch_table = PatchTable()
+    for block in iter_block(file, block_size):
+        patch_table.extend(parse_mutant_block(block))
+    return patch_table
+
+
+def parse_mutant_log(mutant_log_filename, block_size=BLOCK_SIZE):
+    with open(mutant_log_filename, "rb") as file:
+        return parse_mutant_file(file, block_size)
+
+
+def parse_mutant_bytes(data):
+    # a byte range of a mutant log, see PraPRParser._parse_mutant_log_range
+    return parse_mutant_file(io.BytesIO(data), max(1, len(data)))
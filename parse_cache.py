@@ -0,0 +1,94 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def get_file_hash(filename, block_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def get_data_hash(data):
+    # same digest as get_file_hash of a file with this content
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_file_info(filename, file_hash=None):
+    stat = os.stat(filename)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": file_hash if file_hash is not None else get_file_hash(filename),
+    }
+
+
+def get_input_info(input_file_list):
+    return {os.path.basename(filename): get_file_info(filename) for filename in input_file_list}
+
+
+class ParseManifest:
+    # <output_dir>/manifest.json: parser version, output format and the size/mtime/sha256 of
+    # every input of each parsed version, so unchanged versions can be skipped on the next run
+    def __init__(self, output_dir, parser_version, output_format):
+        self._manifest_filename = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._parser_version = parser_version
+        self._output_format = output_format
+        self._version_dict = {}
+
+        if os.path.exists(self._manifest_filename):
+            with open(self._manifest_filename) as file:
+                self._version_dict = json.load(file)["versions"]
+
+
+    def is_fresh(self, key, input_file_list, output_file_list):
+        if key not in self._version_dict:
+            return False
+
+        entry = self._version_dict[key]
+        if entry["parser_version"] != self._parser_version or entry["output_format"] != self._output_format:
+            return False
+
+        if not all(os.path.exists(filename) for filename in output_file_list):
+            return False
+
+        input_info_dict = entry["inputs"]
+        if sorted(input_info_dict.keys()) != sorted(os.path.basename(i) for i in input_file_list):
+            return False
+
+        for filename in input_file_list:
+            recorded_info = input_info_dict[os.path.basename(filename)]
+            stat = os.stat(filename)
+            if stat.st_size != recorded_info["size"]:
+                return False
+
+            # same size and mtime: trust it, otherwise compare content
+            if stat.st_mtime != recorded_info["mtime"]:
+                if get_file_hash(filename) != recorded_info["sha256"]:
+                    return False
+                recorded_info["mtime"] = stat.st_mtime
+
+        return True
+
+
+    def update(self, key, input_info_dict):
+        self._version_dict[key] = {
+            "parser_version": self._parser_version,
+            "output_format": self._output_format,
+            "inputs": input_info_dict,
+        }
+
+
+    def save(self):
+        os.makedirs(os.path.dirname(self._manifest_filename) or ".", exist_ok=True)
+        tmp_filename = self._manifest_filename + ".tmp"
+        with open(tmp_filename, "w") as json_file:
+            json.dump({"versions": self._version_dict}, json_file, indent=4, sort_keys=True)
+
+        os.replace(tmp_filename, self._manifest_filename)
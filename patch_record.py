@@ -0,0 +1,108 @@
+from array import array
+
+
+INT_TYPECODE = "i"
+
+
+class IntListColumn:
+    # one int list per row, stored as a flat int32 buffer plus offsets:
+    # row i is value_column[offset_column[i]:offset_column[i + 1]]
+    __slots__ = ["offset_column", "value_column"]
+
+    def __init__(self):
+        self.offset_column = array(INT_TYPECODE, [0])
+        self.value_column = array(INT_TYPECODE)
+
+
+    def __len__(self):
+        return len(self.offset_column) - 1
+
+
+    def __getitem__(self, row):
+        return self.value_column[self.offset_column[row]:self.offset_column[row + 1]]
+
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+    def append(self, int_list):
+        self.value_column.extend(int_list)
+        self.offset_column.append(len(self.value_column))
+
+
+    def extend(self, other):
+        base = len(self.value_column)
+        self.value_column.extend(other.value_column)
+        self.offset_column.extend(offset + base for offset in other.offset_column[1:])
+
+
+class PatchTable:
+    # the patches of one mutant log in file order, the row is the patch id
+    # methods are interned in order of first appearance, so a method code is also its method id
+    __slots__ = [
+        "method_column",
+        "method_table",
+        "_method_code_dict",
+        "line_column",
+        "test_execution_column",
+        "failed_test_column",
+    ]
+
+    def __init__(self):
+        self.method_column = array(INT_TYPECODE)
+        self.method_table = []
+        self._method_code_dict = {}
+        self.line_column = array(INT_TYPECODE)
+        self.test_execution_column = IntListColumn()
+        self.failed_test_column = IntListColumn()
+
+
+    @classmethod
+    def from_columns(cls, method_table, method_column, line_column, test_execution_column, failed_test_column):
+        # method_column holds codes into method_table, which must list each method once in order of first appearance
+        patch_table = cls()
+        patch_table.method_table = method_table
+        patch_table._method_code_dict = {method: code for code, method in enumerate(method_table)}
+        patch_table.method_column = method_column
+        patch_table.line_column = line_column
+        patch_table.test_execution_column = test_execution_column
+        patch_table.failed_test_column = failed_test_column
+        return patch_table
+
+
+    def __len__(self):
+        return len(self.method_column)
+
+
+    def _get_method_code(self, method):
+        if method not in self._method_code_dict:
+            self._method_code_dict[method] = len(self.method_table)
+            self.method_table.append(method)
+        return self._method_code_dict[method]
+
+
+    def append(self, method, line, test_execution_list, failed_test_list):
+        self.method_column.append(self._get_method_code(method))
+        self.line_column.append(line)
+        self.test_execution_column.append(test_execution_list)
+        self.failed_test_column.append(failed_test_list)
+
+
+    def extend(self, other):
+        # rows of other follow the rows of self, as if both had been parsed in one pass
+        code_mapping = [self._get_method_code(method) for method in other.method_table]
+        self.method_column.extend(code_mapping[code] for code in other.method_column)
+        self.line_column.extend(other.line_column)
+        self.test_execution_column.extend(other.test_execution_column)
+        self.failed_test_column.extend(other.failed_test_column)
+
+
+    def get_method(self, row):
+        return self.method_table[self.method_column[row]]
+
+
+    def get_method_mapping(self):
+        # method id -> method string, the "method" table of the parsed output
+        return dict(enumerate(self.method_table))
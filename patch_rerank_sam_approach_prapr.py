@@ -2,7 +2,17 @@ import os
 import json
 from pprint import pprint
 from utils import compute_score
+from matrix_format import StringColumn, encode_string_column, get_output_extension
+from version_matrix import VersionMatrix
+from parse_cache import get_file_hash
+from result_cache import ResultCache
+from result_store import ResultStore
+from rerank_config import RERANKER_VERSION, SAM_APPROACH_RERANKER, build_store_config
+from instrument import StageTimer, write_report
+from rerank_engine import EntityGroupState, NumpyEntityGroupState, compute_score_array
+from array import array
 import multiprocessing
+import itertools
 import time
 
 
@@ -46,14 +56,43 @@ class PatchRerankerSamApproach:
         modified_entity_level="method",
         num_threads=6,
         treat_nonfix_as_negtive=True,
+        formula_list=None,
+        backend="dict",
+        data_format="json",
+        memory_map=False,
+        cache_dir=None,
+        result_store_dir=None,
+        max_trials=None,
+        instrument=False,
     ):
         self._data_dir = data_dir
+        # per-stage wall/cpu time and peak rss of every version, see instrument.py
+        self._stage_timer = StageTimer(instrument)
+        # results keyed by input file hash + configuration, disabled when cache_dir is None
+        self._result_cache = ResultCache(cache_dir) if cache_dir is not None else None
+        # results go to one append-only store instead of a json file per version when set
+        self._result_store = ResultStore(result_store_dir) if result_store_dir is not None else None
+        # format of the parsed version files: "json" or "binary" (see matrix_format.py)
+        self._data_format = data_format
+        # read binary files through MappedMatrix and rerank on its zero-copy columns
+        assert not memory_map or data_format == "binary", "memory_map needs the binary data format"
+        self._memory_map = memory_map
         self._org_output_dir = output_dir
 
         self._formula = formula
+        # e.g. STATS: all formulas are simulated side by side on each loaded version instead of formula,
+        # the result then has a {"gt", "eval"} per formula
+        self._formula_list = formula_list
+        # stop a version after this many trials without the fix, its result is then marked censored
+        assert max_trials is None or formula_list is None, "max_trials is not supported with formula_list"
+        self._max_trials = max_trials
         self._matrix_type = matrix_type
         self._modified_entity_level = modified_entity_level
         self._num_threads = num_threads
+        # "dict": EntityGroupState, "numpy": NumpyEntityGroupState (needs numpy)
+        assert backend in ["dict", "numpy"], "unknown backend {}".format(backend)
+        self._backend = backend
+        self._treat_nonfix_as_negtive = treat_nonfix_as_negtive
 
         if not treat_nonfix_as_negtive:
             PATCH_CATEGORY_QUALITY_DICT['PatchCategory.NoneFix'] = None
@@ -61,107 +100,128 @@ class PatchRerankerSamApproach:
         else:
             self._output_dir = os.path.join(output_dir, self._matrix_type)
 
-        os.makedirs(self._output_dir, exist_ok=True)
+        if self._result_store is None:
+            os.makedirs(self._output_dir, exist_ok=True)
         self.project_version_tuple_list = []
 
 
     def _revise_version_data(self, version_data):
-        revised_subject_patch_dict = {}
+        # columns ordered by patch id, the row index is the candidate id of the simulation
+        patch_id_list = sorted(version_data.keys(), key=int)
+
+        # int32 columns and a coded patch_category instead of per-patch python objects
+        return {
+            "patch_id": array("i", [int(patch_id) for patch_id in patch_id_list]),
+            "modified_method": array("i", [version_data[patch_id]["method"] for patch_id in patch_id_list]),
+            "patch_category": StringColumn(*encode_string_column(
+                version_data[patch_id]["patch_category"] for patch_id in patch_id_list
+            )),
+        }
 
-        for patch_id, patch_data in version_data.items():
-            patch_id = int(patch_id)
-
-            revised_subject_patch_dict[patch_id] = {
-                "modified_method": patch_data["method"],
-                "true_positive": 1,
-                "false_positive": 1,
-                "true_negative": 1,
-                "false_negative": 1,
-                "priority": 0.0,
-                "validated": False,
-                "patch_category": patch_data["patch_category"],
-                "init_priority": 0.0,
+
+    def _revise_mapped_data(self, mapped_matrix):
+        patch_id_column = mapped_matrix.get_column("patch_id")
+        method_column = mapped_matrix.get_column("method")
+        patch_category_column = mapped_matrix.get_column("patch_category")
+
+        if all(patch_id_column[i] < patch_id_column[i + 1] for i in range(len(patch_id_column) - 1)):
+            return {
+                "patch_id": patch_id_column,
+                "modified_method": method_column,
+                "patch_category": patch_category_column,
             }
-        
-        return revised_subject_patch_dict
+
+        # rows are not ordered by patch id, fall back to sorted copies
+        row_list = sorted(range(len(patch_id_column)), key=patch_id_column.__getitem__)
+        return {
+            "patch_id": [patch_id_column[row] for row in row_list],
+            "modified_method": [method_column[row] for row in row_list],
+            "patch_category": [patch_category_column[row] for row in row_list],
+        }
     
 
     def get_all_project_version_tuple(self):
         data_path = os.path.join(self._data_dir, self._matrix_type)
-        word_list = [i.replace(".json", "") for i in os.listdir(data_path) if i.endswith(".json")]
+        data_extension = get_output_extension(self._data_format)
+        word_list = [i.replace(data_extension, "") for i in os.listdir(data_path) if i.endswith(data_extension)]
         for i in word_list:
             proj, version_str = i.split("_")
             self.project_version_tuple_list.append((proj, int(version_str)))
 
 
-    def _get_validation_candidate(self, revised_version_data):
-        id_list = sorted(list(revised_version_data.keys()))
-        selected_candidate_id = -1
-        for id in id_list:
-            if not revised_version_data[id]["validated"]:
-                # init
-                if selected_candidate_id == -1:
-                    selected_candidate_id = id
-                
-                cur_candidate_priority = revised_version_data[id]["priority"]
-                selected_candidate_priority = revised_version_data[selected_candidate_id]["priority"]
-
-                if cur_candidate_priority > selected_candidate_priority:
-                    selected_candidate_id = id
-        
-        return selected_candidate_id
+    def _build_group_state(self, revised_subject_patch_table):
+        modified_method_column = revised_subject_patch_table["modified_method"]
+
+        if self._backend == "numpy":
+            return NumpyEntityGroupState(range(len(modified_method_column)), modified_method_column)
+
+        return EntityGroupState(enumerate(modified_method_column))
+
+
+    def _get_validation_candidate(self, group_state):
+        # highest priority first, lowest patch id on ties
+        return group_state.get_candidate()
     
 
-    def _update_subject_patch(self, revised_subject_patch_dict, selected_candidate_id):
+    def _update_subject_patch(self, revised_subject_patch_table, group_state, selected_candidate_id):
         # patch_category relates to priority
-        selected_modified_method = revised_subject_patch_dict[selected_candidate_id]["modified_method"]
+        selected_modified_method = revised_subject_patch_table["modified_method"][selected_candidate_id]
         selected_patch_quality = PATCH_CATEGORY_QUALITY_DICT[
-            revised_subject_patch_dict[selected_candidate_id]["patch_category"]
+            revised_subject_patch_table["patch_category"][selected_candidate_id]
         ]
 
-        revised_subject_patch_dict[selected_candidate_id]["validated"] = True
-        # modified_method: computed_score
-        cached_result = {}
+        group_state.validate(selected_candidate_id, selected_modified_method, selected_patch_quality)
+
+        if self._backend == "numpy":
+            true_positive, false_positive, true_negative, false_negative = group_state.get_counter_arrays()
+            group_state.set_priority_array(compute_score_array(
+                true_positive,
+                false_positive,
+                true_negative,
+                false_negative,
+                self._formula
+            ))
+            return
 
-        for id, patch_data in revised_subject_patch_dict.items():
-            if not revised_subject_patch_dict[id]["validated"]:
-                cur_modified_method = revised_subject_patch_dict[id]["modified_method"]
-                if cur_modified_method == selected_modified_method:
-                    num_match, num_diff = [1, 0]
-                else:
-                    num_match, num_diff = [0, 1]
-
-                if selected_patch_quality == "GOOD":
-                    revised_subject_patch_dict[id]["true_positive"] += num_match
-                    revised_subject_patch_dict[id]["false_positive"] += num_diff
-
-                if selected_patch_quality == "BAD":
-                    revised_subject_patch_dict[id]["true_negative"] += num_match
-                    revised_subject_patch_dict[id]["false_negative"] += num_diff
-
-                if cur_modified_method not in cached_result:
-                    computed_score = compute_score(
-                        revised_subject_patch_dict[id]["true_positive"],
-                        revised_subject_patch_dict[id]["false_positive"],
-                        revised_subject_patch_dict[id]["true_negative"],
-                        revised_subject_patch_dict[id]["false_negative"],
-                        self._formula
-                    )
-                    cached_result[cur_modified_method] = computed_score
-                else:
-                    computed_score = cached_result[cur_modified_method]
+        # all unvalidated patches of one modified_method share the same score
+        for modified_method in group_state.get_entity_list():
+            true_positive, false_positive, true_negative, false_negative = group_state.get_counters(modified_method)
+            computed_score = compute_score(
+                true_positive,
+                false_positive,
+                true_negative,
+                false_negative,
+                self._formula
+            )
+            group_state.set_priority(modified_method, computed_score)
 
-                revised_subject_patch_dict[id]["priority"] = (
-                    revised_subject_patch_dict[id]["init_priority"] + computed_score
-                )
+
+    def _is_informative(self, patch_category):
+        # validating the patch changes the counters, and so possibly the priorities
+        return patch_category != "PatchCategory.CleanFixFull" and PATCH_CATEGORY_QUALITY_DICT.get(patch_category) in ["GOOD", "BAD"]
+
+
+    def _is_order_fixed(self, group_state, num_informative):
+        # nothing can reorder the remaining patches before the fix: a single entity is left
+        # (validated by patch id), or no remaining patch changes the counters (priorities are frozen)
+        return num_informative == 0 or group_state.get_num_entities() <= 1
 
 
-    def _compute_baseline(self, revised_subject_patch_dict):
-        id_list = sorted(list(revised_subject_patch_dict.keys()))
+    def _get_fixed_order_fix(self, revised_subject_patch_table, group_state):
+        # the fix get_candidate() returns first as long as no priority changes
+        modified_method_column = revised_subject_patch_table["modified_method"]
+        return min(
+            (-group_state.get_priority(modified_method_column[patch_id]), patch_id)
+            for patch_id, patch_category in enumerate(revised_subject_patch_table["patch_category"])
+            if patch_category == "PatchCategory.CleanFixFull"
+        )[1]
+
+
+    def _compute_baseline(self, revised_subject_patch_table):
         cnt = 0
-        for id in id_list:
+        for patch_category in revised_subject_patch_table["patch_category"]:
             cnt += 1
-            if revised_subject_patch_dict[id]["patch_category"] == "PatchCategory.CleanFixFull":
+            if patch_category == "PatchCategory.CleanFixFull":
                 return cnt
 
 
@@ -173,57 +233,294 @@ class PatchRerankerSamApproach:
         return False
 
 
+    def _get_cache_config(self):
+        # everything besides the input file that changes the result
+        cache_config = {
+            "reranker": SAM_APPROACH_RERANKER,
+            "reranker_version": RERANKER_VERSION,
+            "formula": self._formula if self._formula_list is None else self._formula_list,
+            "matrix_type": self._matrix_type,
+            "modified_entity_level": self._modified_entity_level,
+            "patch_category_quality": PATCH_CATEGORY_QUALITY_DICT,
+        }
+        if self._max_trials is not None:
+            cache_config["max_trials"] = self._max_trials
+
+        return cache_config
+
+
+    def get_cached_result(self, input_hash):
+        # (is_cached, result)
+        if self._result_cache is None:
+            return False, None
+
+        return self._result_cache.get(self._result_cache.get_key(input_hash, self._get_cache_config()))
+
+
+    def put_cached_result(self, input_hash, result):
+        if self._result_cache is None:
+            return
+
+        self._result_cache.put(self._result_cache.get_key(input_hash, self._get_cache_config()), result)
+
+
+    def get_store_config(self):
+        # what a result is queried by in the results store, see result_store.py
+        return build_store_config(
+            SAM_APPROACH_RERANKER,
+            self._formula if self._formula_list is None else self._formula_list,
+            self._matrix_type,
+            self._modified_entity_level,
+            self._treat_nonfix_as_negtive,
+            self._max_trials,
+        )
+
+
+    def set_result_store(self, result_store):
+        # lets a sweep batch the results of all its configurations into one store
+        self._result_store = result_store
+
+
+    def write_result(self, project, version, result):
+        if result is None:
+            return
+
+        if self._result_store is not None:
+            self._result_store.add(project, version, self.get_store_config(), result)
+            return
+
+        output_filename = os.path.join(self._output_dir, "{}_{}.json".format(project, version))
+        with open(output_filename, 'w') as json_file:
+            json.dump(result, json_file, indent=4)
+
+
     def jit_patch_rerank(self, project_version_tuple):
         project, version = project_version_tuple
         print("processing {} - {} - {}".format(project, version, self._matrix_type))
 
-        json_file = os.path.join(self._data_dir, self._matrix_type, "{}_{}.json".format(project, version))
-        with open(json_file) as file:
-            repair_data = json.load(file)
+        data_file = os.path.join(
+            self._data_dir, self._matrix_type, "{}_{}{}".format(project, version, get_output_extension(self._data_format))
+        )
+
+        self._stage_timer.start_version("{}_{}".format(project, version))
+        with self._stage_timer.stage("cache"):
+            input_hash = get_file_hash(data_file) if self._result_cache is not None else None
+            is_cached, result = self.get_cached_result(input_hash)
+
+        if not is_cached:
+            result = self.rerank_data_file(data_file)
+            self.put_cached_result(input_hash, result)
+
+        with self._stage_timer.stage("write"):
+            self.write_result(project, version, result)
+
+        # the results of the task reach the shard now, not when the pool worker exits
+        if self._result_store is not None:
+            self._result_store.flush()
+
+        # pool workers hand their records back to run_all
+        return self._stage_timer.pop_record_list()
+
+
+    def rerank_data_file(self, data_file):
+        # None when the version has no plausible fix
+        if self._memory_map:
+            with self._stage_timer.stage("load"):
+                mapped_matrix = VersionMatrix(data_file, "binary")
+            # closed even when the rerank raises, pool workers live for the whole run
+            with mapped_matrix:
+                if "PatchCategory.CleanFixFull" not in mapped_matrix.get_column("patch_category"):
+                    return None
+
+                with self._stage_timer.stage("revise"):
+                    revised_subject_patch_table = self._revise_mapped_data(mapped_matrix)
+                return self._rerank_patch_table(revised_subject_patch_table)
+
+        with self._stage_timer.stage("load"):
+            # only the two patch fields the simulation reads, the tables are never loaded
+            with VersionMatrix(data_file, self._data_format) as version_matrix:
+                version_data = version_matrix.get_patch_dict(["method", "patch_category"])
 
-        result = {}
-        version_data = repair_data["patch"]
         if not self.doesIncludePlausibleFix(version_data):
-            return
+            return None
+
+        with self._stage_timer.stage("revise"):
+            revised_subject_patch_table = self._revise_version_data(version_data)
+        return self._rerank_patch_table(revised_subject_patch_table)
+
+
+    def _get_formula_candidate_dict(self, group_state, formula_list):
+        # formula -> next candidate of its simulation, the counters are read once for all formulas
+        formula_candidate_dict = {}
+
+        if self._backend == "numpy":
+            counter_array_tuple = group_state.get_counter_arrays()
+            for formula in formula_list:
+                group_state.set_priority_array(compute_score_array(*counter_array_tuple, formula))
+                formula_candidate_dict[formula] = self._get_validation_candidate(group_state)
+            return formula_candidate_dict
+
+        entity_list = group_state.get_entity_list()
+        counter_dict = {modified_method: group_state.get_counters(modified_method) for modified_method in entity_list}
+        for formula in formula_list:
+            if len(entity_list) == 0:
+                formula_candidate_dict[formula] = -1
+                continue
+
+            # highest priority first, lowest patch id on ties
+            selected_modified_method = max(entity_list, key=lambda modified_method: (
+                compute_score(*counter_dict[modified_method], formula),
+                -group_state.get_head_patch_id(modified_method),
+            ))
+            formula_candidate_dict[formula] = group_state.get_head_patch_id(selected_modified_method)
+
+        return formula_candidate_dict
+
+
+    def _rerank_patch_table_batch(self, revised_subject_patch_table):
+        # same trajectory as _rerank_patch_table for every formula of self._formula_list, formulas
+        # that pick the same candidates share one group state and it is only copied where they diverge
+        with self._stage_timer.stage("baseline"):
+            baseline_rank = self._compute_baseline(revised_subject_patch_table)
+        patch_category_column = revised_subject_patch_table["patch_category"]
+        modified_method_column = revised_subject_patch_table["modified_method"]
+
+        formula_trials_dict = {}
+        num_validated = 0
+        with self._stage_timer.stage("simulate"):
+            group_state = self._build_group_state(revised_subject_patch_table)
+
+            # (group state, formulas on this trajectory, their next candidate, trials counted so far)
+            # all priorities start equal, so every formula validates the same patch first
+            branch_list = [(group_state, self._formula_list, self._get_validation_candidate(group_state), 1)]
+            while len(branch_list) > 0:
+                group_state, formula_list, selected_candidate_id, num_trials = branch_list.pop()
+
+                group_state.validate(
+                    selected_candidate_id,
+                    modified_method_column[selected_candidate_id],
+                    PATCH_CATEGORY_QUALITY_DICT[patch_category_column[selected_candidate_id]],
+                )
+                num_validated += 1
 
-        revised_subject_patch_dict = self._revise_version_data(version_data)
-        baseline_rank = self._compute_baseline(revised_subject_patch_dict)
+                if patch_category_column[selected_candidate_id] == "PatchCategory.CleanFixFull":
+                    for formula in formula_list:
+                        formula_trials_dict[formula] = num_trials
+                    continue
 
-        visited_patch_id_list = []
-        selected_candidate_id = self._get_validation_candidate(revised_subject_patch_dict)
-        self._update_subject_patch(revised_subject_patch_dict, selected_candidate_id)
+                # next candidate -> formulas choosing it
+                candidate_formula_dict = {}
+                for formula, candidate_id in self._get_formula_candidate_dict(group_state, formula_list).items():
+                    candidate_formula_dict.setdefault(candidate_id, []).append(formula)
 
-        selected_candidate_patch_category = revised_subject_patch_dict[selected_candidate_id]["patch_category"]
-        visited_patch_id_list.append(selected_candidate_id)
+                for branch_idx, (candidate_id, candidate_formula_list) in enumerate(candidate_formula_dict.items()):
+                    if candidate_id == -1:
+                        assert num_trials == len(patch_category_column), "error for checked all patches"
+                        for formula in candidate_formula_list:
+                            formula_trials_dict[formula] = num_trials
+                        continue
 
-        while selected_candidate_patch_category != "PatchCategory.CleanFixFull":
-            selected_candidate_id = self._get_validation_candidate(revised_subject_patch_dict)
-            if selected_candidate_id != -1:
-                visited_patch_id_list.append(selected_candidate_id)
-            else:
-                assert len(visited_patch_id_list) == len(revised_subject_patch_dict.keys()), "error for checked all patches"
-                break
+                    # each candidate is counted once when selected and once after its update
+                    branch_group_state = group_state if branch_idx == 0 else group_state.copy()
+                    branch_list.append((branch_group_state, candidate_formula_list, candidate_id, num_trials + 2))
+
+        self._stage_timer.add_count("iterations", num_validated)
+
+        result = {}
+        for formula in self._formula_list:
+            result[formula] = {
+                "gt": baseline_rank,
+                "eval": formula_trials_dict[formula],
+            }
 
-            self._update_subject_patch(revised_subject_patch_dict, selected_candidate_id)
-            selected_candidate_patch_category = revised_subject_patch_dict[selected_candidate_id]["patch_category"]
+        return result
+
+
+    def _rerank_patch_table(self, revised_subject_patch_table):
+        if self._formula_list is not None:
+            return self._rerank_patch_table_batch(revised_subject_patch_table)
+
+        result = {}
+        with self._stage_timer.stage("baseline"):
+            baseline_rank = self._compute_baseline(revised_subject_patch_table)
+        patch_category_column = revised_subject_patch_table["patch_category"]
+
+        censored = False
+        num_fixed_order_trials = 0
+        # patches the loop validated, the closed-form tail excluded (iterations of the instrument report)
+        num_validated = 1
+        with self._stage_timer.stage("simulate"):
+            group_state = self._build_group_state(revised_subject_patch_table)
+            num_informative = sum(1 for patch_category in patch_category_column if self._is_informative(patch_category))
+
+            visited_patch_id_list = []
+            selected_candidate_id = self._get_validation_candidate(group_state)
+            self._update_subject_patch(revised_subject_patch_table, group_state, selected_candidate_id)
+
+            selected_candidate_patch_category = patch_category_column[selected_candidate_id]
             visited_patch_id_list.append(selected_candidate_id)
+            if self._is_informative(selected_candidate_patch_category):
+                num_informative -= 1
+
+            while selected_candidate_patch_category != "PatchCategory.CleanFixFull":
+                # a step counts two trials, censored as soon as the next one would go past max_trials
+                if self._max_trials is not None and len(visited_patch_id_list) + 2 > self._max_trials:
+                    censored = True
+                    break
+
+                if self._is_order_fixed(group_state, num_informative):
+                    # the rest of the trajectory without scoring: the fix and the patches before it in the fixed order
+                    self._stage_timer.add_count("closed_form", 1)
+                    fix_patch_id = self._get_fixed_order_fix(revised_subject_patch_table, group_state)
+                    num_steps = 1 + group_state.count_fixed_order_before(
+                        fix_patch_id, revised_subject_patch_table["modified_method"][fix_patch_id]
+                    )
+                    if self._max_trials is not None and len(visited_patch_id_list) + 2 * num_steps > self._max_trials:
+                        censored = True
+                        num_steps = (self._max_trials - len(visited_patch_id_list)) // 2
+
+                    # counted when selected and after its update, as in the loop below
+                    num_fixed_order_trials = 2 * num_steps
+                    self._stage_timer.add_count("closed_form_trials", num_fixed_order_trials)
+                    break
+
+                selected_candidate_id = self._get_validation_candidate(group_state)
+                if selected_candidate_id != -1:
+                    visited_patch_id_list.append(selected_candidate_id)
+                else:
+                    assert len(visited_patch_id_list) == len(patch_category_column), "error for checked all patches"
+                    break
+
+                self._update_subject_patch(revised_subject_patch_table, group_state, selected_candidate_id)
+                num_validated += 1
+                selected_candidate_patch_category = patch_category_column[selected_candidate_id]
+                visited_patch_id_list.append(selected_candidate_id)
+                if self._is_informative(selected_candidate_patch_category):
+                    num_informative -= 1
 
-        num_trials = len(visited_patch_id_list)
+        num_trials = len(visited_patch_id_list) + num_fixed_order_trials
+        self._stage_timer.add_count("iterations", num_validated)
 
         result = {
             "gt": baseline_rank,
             "eval": num_trials,
         }
+        if self._max_trials is not None:
+            # censored: the fix was not reached within max_trials, eval is a lower bound
+            result["censored"] = censored
+
+        return result
 
-        output_filename = os.path.join(self._output_dir, "{}_{}.json".format(project, version))
-        with open(output_filename, 'w') as json_file:
-            json.dump(result, json_file, indent=4)
-        
 
     def run_all(self):
         self.get_all_project_version_tuple()
         pool = multiprocessing.Pool(processes=self._num_threads)
-        pool.map(self.jit_patch_rerank, self.project_version_tuple_list)
+        record_list_list = pool.map(self.jit_patch_rerank, self.project_version_tuple_list)
+        pool.close()
+        pool.join()
+
+        if self._stage_timer.enabled:
+            write_report(list(itertools.chain(*record_list_list)), self._output_dir + "_instrument_report.json")
 
 
 if __name__ == "__main__":
@@ -238,6 +535,7 @@ if __name__ == "__main__":
         matrix_type="partial",
         modified_entity_level="method",
         num_threads=8,
+        cache_dir=os.path.abspath("rerank_cache"),
     )
     pr.run_all()
     print("--- {} mins ---".format((time.time() - start_time) / 60.0))
@@ -251,6 +549,7 @@ if __name__ == "__main__":
         matrix_type="full",
         modified_entity_level="method",
         num_threads=8,
+        cache_dir=os.path.abspath("rerank_cache"),
     )
     pr.run_all()
     print("--- {} mins ---".format((time.time() - start_time) / 60.0))
\ No newline at end of file
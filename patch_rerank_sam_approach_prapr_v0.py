@@ -2,7 +2,19 @@ import os
 import json
 from pprint import pprint
 from utils import compute_score
+from matrix_format import StringColumn, encode_string_column, get_output_extension
+from version_matrix import VersionMatrix
+from array import array
+from parse_cache import get_file_hash
+from entity_index import get_class_package, get_method_class
+from result_cache import ResultCache
+from result_store import ResultStore
+from rerank_config import RERANKER_VERSION, SAM_APPROACH_V0_RERANKER, build_store_config
+from instrument import StageTimer, write_report
+from rerank_engine import EntityGroupState, NumpyEntityGroupState, compute_score_array
 import multiprocessing
+import itertools
+import contextlib
 import time
 
 
@@ -17,6 +29,118 @@ PATCH_CATEGORY_QUALITY_DICT ={
 }
 
 
+def get_method_entity_mapping(method_map, modified_entity_level):
+    # method id (str) -> class/package id
+    modified_entity_id_mapping = {}
+    org_new_id_mapping = {}
+
+    for id, method in method_map.items():
+        clazz = get_method_class(method)
+        pkg = get_class_package(clazz)
+
+        if modified_entity_level == "class":
+            entity = clazz
+
+        if modified_entity_level == "package":
+            entity = pkg
+        
+        if entity not in modified_entity_id_mapping:
+            modified_entity_id_mapping[entity] = len(modified_entity_id_mapping.keys())
+        
+        org_new_id_mapping[id] = modified_entity_id_mapping[entity]
+
+    return org_new_id_mapping
+
+
+def has_patch_field(repair_data, field):
+    # fields are the same for every patch of a version
+    for patch_data in repair_data["patch"].values():
+        return field in patch_data
+    return False
+
+
+def get_repair_data_field_list(version_matrix, modified_entity_level_list):
+    # patch fields (and tables) get_modified_entity_dict and the simulation read for these levels
+    field_list = ["patch_category"]
+    table_name_list = []
+
+    for modified_entity_level in modified_entity_level_list:
+        if modified_entity_level == "method" or version_matrix.has_column(modified_entity_level):
+            field_list.append(modified_entity_level)
+        elif modified_entity_level == "statement":
+            field_list += ["method", "line"]
+        elif modified_entity_level in ["class", "package"]:
+            field_list.append("method")
+            table_name_list.append("method")
+
+    return list(dict.fromkeys(field_list)), list(dict.fromkeys(table_name_list))
+
+
+def load_repair_data(data_file, data_format, modified_entity_level_list):
+    # repair_data with only the patch fields and tables needed at these levels,
+    # the test table and the per-patch counts are never loaded
+    with VersionMatrix(data_file, data_format) as version_matrix:
+        field_list, table_name_list = get_repair_data_field_list(version_matrix, modified_entity_level_list)
+        repair_data = {"patch": version_matrix.get_patch_dict(field_list)}
+        for table_name in table_name_list:
+            repair_data[table_name] = version_matrix.get_table(table_name)
+
+    return repair_data
+
+
+def get_modified_entity_dict(repair_data, modified_entity_level):
+    # patch_id -> modified entity id at the given level, repair_data is left untouched
+    # parser output with an entity index (see entity_index.py) already has the id per patch
+    if modified_entity_level == "method" or has_patch_field(repair_data, modified_entity_level):
+        return {patch_id: patch_data[modified_entity_level] for patch_id, patch_data in repair_data["patch"].items()}
+
+    modified_entity_dict = {}
+
+    if modified_entity_level in ["class", "package"]:
+        org_new_id_mapping = get_method_entity_mapping(repair_data["method"], modified_entity_level)
+        for patch_id, patch_data in repair_data["patch"].items():
+            modified_entity_dict[patch_id] = org_new_id_mapping[str(patch_data["method"])]
+    
+    if modified_entity_level == "statement":
+        modified_entity_id_mapping = {}
+
+        for patch_id, patch_data in repair_data["patch"].items():
+            statement = str(patch_data["method"]) + "_" + str(patch_data["line"])
+
+            if statement not in modified_entity_id_mapping:
+                modified_entity_id_mapping[statement] = len(modified_entity_id_mapping.keys())
+
+            modified_entity_dict[patch_id] = modified_entity_id_mapping[statement]
+
+    return modified_entity_dict
+
+
+def get_modified_entity_column(mapped_matrix, modified_entity_level):
+    # same as get_modified_entity_dict but row-aligned with the columns of a binary VersionMatrix,
+    # the method level (and every level of an entity index) is the mapped column itself
+    if mapped_matrix.has_column(modified_entity_level):
+        return mapped_matrix.get_column(modified_entity_level)
+
+    method_column = mapped_matrix.get_column("method")
+
+    if modified_entity_level in ["class", "package"]:
+        org_new_id_mapping = get_method_entity_mapping(mapped_matrix.get_table("method"), modified_entity_level)
+        return array("i", [org_new_id_mapping[str(method)] for method in method_column])
+
+    if modified_entity_level == "statement":
+        modified_entity_id_mapping = {}
+        modified_entity_column = array("i")
+
+        for method, line in zip(method_column, mapped_matrix.get_column("line")):
+            statement = (method, line)
+            if statement not in modified_entity_id_mapping:
+                modified_entity_id_mapping[statement] = len(modified_entity_id_mapping.keys())
+
+            modified_entity_column.append(modified_entity_id_mapping[statement])
+
+        return modified_entity_column
+
+
 class PatchRerankerSamApproach:
     def __init__(
         self,
@@ -26,18 +150,48 @@ class PatchRerankerSamApproach:
         matrix_type="partial",
         modified_entity_level="method",
         num_threads=6,
+        backend="dict",
+        treat_nonfix_as_negtive=False,
+        data_format="json",
+        memory_map=False,
+        cache_dir=None,
+        result_store_dir=None,
+        max_trials=None,
+        instrument=False,
     ):
         self._data_dir = data_dir
+        # per-stage wall/cpu time and peak rss of every version, see instrument.py
+        self._stage_timer = StageTimer(instrument)
+        # results keyed by input file hash + configuration, disabled when cache_dir is None
+        self._result_cache = ResultCache(cache_dir) if cache_dir is not None else None
+        # results go to one append-only store instead of a json file per version when set
+        self._result_store = ResultStore(result_store_dir) if result_store_dir is not None else None
+        # format of the parsed version files: "json" or "binary" (see matrix_format.py)
+        self._data_format = data_format
+        # read binary files through MappedMatrix and rerank on its zero-copy columns
+        assert not memory_map or data_format == "binary", "memory_map needs the binary data format"
+        self._memory_map = memory_map
 
         self._formula = formula
         self._matrix_type = matrix_type
         self._modified_entity_level = modified_entity_level
         self._num_threads = num_threads
+        # "dict": EntityGroupState, "numpy": NumpyEntityGroupState (needs numpy)
+        assert backend in ["dict", "numpy"], "unknown backend {}".format(backend)
+        self._backend = backend
+        self._treat_nonfix_as_negtive = treat_nonfix_as_negtive
+        # stop a version after this many trials without the fix, its result is then marked censored
+        self._max_trials = max_trials
+
+        self._patch_category_quality_dict = dict(PATCH_CATEGORY_QUALITY_DICT)
+        if treat_nonfix_as_negtive:
+            self._patch_category_quality_dict['PatchCategory.NoneFix'] = "BAD"
 
         output_dir = output_dir + "_{}".format(modified_entity_level)
         self._output_dir = os.path.join(output_dir, self._matrix_type)
 
-        os.makedirs(self._output_dir, exist_ok=True)
+        if self._result_store is None:
+            os.makedirs(self._output_dir, exist_ok=True)
         self.project_version_tuple_list = []
     
 
@@ -52,143 +206,130 @@ class PatchRerankerSamApproach:
             pactch_data.pop(patch_id)
    
 
-    def change_repair_data_level(self, repair_data):
-        if self._modified_entity_level == "method":
-            return
+    def _revise_version_data(self, version_data, modified_entity_dict):
+        # columns ordered by patch id, the row index is the candidate id of the simulation
+        patch_id_list = sorted(version_data.keys(), key=int)
+
+        # int32 columns and a coded patch_category instead of per-patch python objects
+        return {
+            "patch_id": array("i", [int(patch_id) for patch_id in patch_id_list]),
+            "modified_method": array("i", [modified_entity_dict[patch_id] for patch_id in patch_id_list]),
+            "patch_category": StringColumn(*encode_string_column(
+                version_data[patch_id]["patch_category"] for patch_id in patch_id_list
+            )),
+        }
 
-        if self._modified_entity_level in ["class", "package"]:
-            modified_entity_id_mapping = {}
-            method_map = repair_data["method"]
-            org_new_id_mapping = {}
-
-            for id, method in method_map.items():
-                clazz = method.split(":")[0]
-                pkg = ".".join(clazz.split(".")[:-1])
-
-                if self._modified_entity_level == "class":
-                    entity = clazz
-
-                if self._modified_entity_level == "package":
-                    entity = pkg
-                
-                if entity not in modified_entity_id_mapping:
-                    modified_entity_id_mapping[entity] = len(modified_entity_id_mapping.keys())
-                
-                org_new_id_mapping[id] = modified_entity_id_mapping[entity]
-            
-            for patch_id, patch_data in repair_data["patch"].items():
-                patch_data["method"] = org_new_id_mapping[str(patch_data["method"])]
-        
-        if self._modified_entity_level == "statement":
-            modified_entity_id_mapping = {}
 
-            for patch_id, patch_data in repair_data["patch"].items():
-                statement = str(patch_data["method"]) + "_" + str(patch_data["line"])
+    def _revise_mapped_data(self, mapped_matrix, modified_entity_column):
+        patch_id_column = mapped_matrix.get_column("patch_id")
+        patch_category_column = mapped_matrix.get_column("patch_category")
 
-                if statement not in modified_entity_id_mapping:
-                    modified_entity_id_mapping[statement] = len(modified_entity_id_mapping.keys())
+        if all(patch_id_column[i] < patch_id_column[i + 1] for i in range(len(patch_id_column) - 1)):
+            return {
+                "patch_id": patch_id_column,
+                "modified_method": modified_entity_column,
+                "patch_category": patch_category_column,
+            }
 
-                statement_id = modified_entity_id_mapping[statement]
-                patch_data["method"] = statement_id
+        # rows are not ordered by patch id, fall back to sorted copies
+        row_list = sorted(range(len(patch_id_column)), key=patch_id_column.__getitem__)
+        return {
+            "patch_id": [patch_id_column[row] for row in row_list],
+            "modified_method": [modified_entity_column[row] for row in row_list],
+            "patch_category": [patch_category_column[row] for row in row_list],
+        }
+    
 
+    def get_modified_entity_level(self):
+        return self._modified_entity_level
 
-    def _revise_version_data(self, version_data):
-        revised_subject_patch_dict = {}
-
-        for patch_id, patch_data in version_data.items():
-            patch_id = int(patch_id)
-
-            revised_subject_patch_dict[patch_id] = {
-                "modified_method": patch_data["method"],
-                "true_positive": 1,
-                "false_positive": 1,
-                "true_negative": 1,
-                "false_negative": 1,
-                "priority": 0.0,
-                "validated": False,
-                "patch_category": patch_data["patch_category"],
-                "init_priority": 0.0,
-            }
-        
-        return revised_subject_patch_dict
-    
 
     def get_all_project_version_tuple(self):
         data_path = os.path.join(self._data_dir, self._matrix_type)
-        word_list = [i.replace(".json", "") for i in os.listdir(data_path) if i.endswith(".json")]
+        data_extension = get_output_extension(self._data_format)
+        word_list = [i.replace(data_extension, "") for i in os.listdir(data_path) if i.endswith(data_extension)]
+        # listed again on every call instead of appended to the previous listing
+        self.project_version_tuple_list = []
         for i in word_list:
             proj, version_str = i.split("_")
             self.project_version_tuple_list.append((proj, int(version_str)))
 
+        return self.project_version_tuple_list
 
-    def _get_validation_candidate(self, revised_version_data):
-        id_list = sorted(list(revised_version_data.keys()))
-        selected_candidate_id = -1
-        for id in id_list:
-            if not revised_version_data[id]["validated"]:
-                # init
-                if selected_candidate_id == -1:
-                    selected_candidate_id = id
-                
-                cur_candidate_priority = revised_version_data[id]["priority"]
-                selected_candidate_priority = revised_version_data[selected_candidate_id]["priority"]
-
-                if cur_candidate_priority > selected_candidate_priority:
-                    selected_candidate_id = id
-        
-        return selected_candidate_id
+
+    def _build_group_state(self, revised_subject_patch_table):
+        modified_method_column = revised_subject_patch_table["modified_method"]
+
+        if self._backend == "numpy":
+            return NumpyEntityGroupState(range(len(modified_method_column)), modified_method_column)
+
+        return EntityGroupState(enumerate(modified_method_column))
+
+
+    def _get_validation_candidate(self, group_state):
+        # highest priority first, lowest patch id on ties
+        return group_state.get_candidate()
     
 
-    def _update_subject_patch(self, revised_subject_patch_dict, selected_candidate_id):
+    def _update_subject_patch(self, revised_subject_patch_table, group_state, selected_candidate_id):
         # patch_category relates to priority
-        selected_modified_method = revised_subject_patch_dict[selected_candidate_id]["modified_method"]
-        selected_patch_quality = PATCH_CATEGORY_QUALITY_DICT[
-            revised_subject_patch_dict[selected_candidate_id]["patch_category"]
+        selected_modified_method = revised_subject_patch_table["modified_method"][selected_candidate_id]
+        selected_patch_quality = self._patch_category_quality_dict[
+            revised_subject_patch_table["patch_category"][selected_candidate_id]
         ]
 
-        revised_subject_patch_dict[selected_candidate_id]["validated"] = True
-        # modified_method: computed_score
-        cached_result = {}
+        group_state.validate(selected_candidate_id, selected_modified_method, selected_patch_quality)
+
+        if self._backend == "numpy":
+            true_positive, false_positive, true_negative, false_negative = group_state.get_counter_arrays()
+            group_state.set_priority_array(compute_score_array(
+                true_positive,
+                false_positive,
+                true_negative,
+                false_negative,
+                self._formula
+            ))
+            return
 
-        for id, patch_data in revised_subject_patch_dict.items():
-            if not revised_subject_patch_dict[id]["validated"]:
-                cur_modified_method = revised_subject_patch_dict[id]["modified_method"]
-                if cur_modified_method == selected_modified_method:
-                    num_match, num_diff = [1, 0]
-                else:
-                    num_match, num_diff = [0, 1]
-
-                if selected_patch_quality == "GOOD":
-                    revised_subject_patch_dict[id]["true_positive"] += num_match
-                    revised_subject_patch_dict[id]["false_positive"] += num_diff
-
-                if selected_patch_quality == "BAD":
-                    revised_subject_patch_dict[id]["true_negative"] += num_match
-                    revised_subject_patch_dict[id]["false_negative"] += num_diff
-
-                if cur_modified_method not in cached_result:
-                    computed_score = compute_score(
-                        revised_subject_patch_dict[id]["true_positive"],
-                        revised_subject_patch_dict[id]["false_positive"],
-                        revised_subject_patch_dict[id]["true_negative"],
-                        revised_subject_patch_dict[id]["false_negative"],
-                        self._formula
-                    )
-                    cached_result[cur_modified_method] = computed_score
-                else:
-                    computed_score = cached_result[cur_modified_method]
+        # all unvalidated patches of one modified_method share the same score
+        for modified_method in group_state.get_entity_list():
+            true_positive, false_positive, true_negative, false_negative = group_state.get_counters(modified_method)
+            computed_score = compute_score(
+                true_positive,
+                false_positive,
+                true_negative,
+                false_negative,
+                self._formula
+            )
+            group_state.set_priority(modified_method, computed_score)
+
+
+    def _is_informative(self, patch_category):
+        # validating the patch changes the counters, and so possibly the priorities
+        return patch_category != "PatchCategory.CleanFixFull" and self._patch_category_quality_dict.get(patch_category) in ["GOOD", "BAD"]
 
-                revised_subject_patch_dict[id]["priority"] = (
-                    revised_subject_patch_dict[id]["init_priority"] + computed_score
-                )
 
+    def _is_order_fixed(self, group_state, num_informative):
+        # nothing can reorder the remaining patches before the fix: a single entity is left
+        # (validated by patch id), or no remaining patch changes the counters (priorities are frozen)
+        return num_informative == 0 or group_state.get_num_entities() <= 1
 
-    def _compute_baseline(self, revised_subject_patch_dict):
-        id_list = sorted(list(revised_subject_patch_dict.keys()))
+
+    def _get_fixed_order_fix(self, revised_subject_patch_table, group_state):
+        # the fix get_candidate() returns first as long as no priority changes
+        modified_method_column = revised_subject_patch_table["modified_method"]
+        return min(
+            (-group_state.get_priority(modified_method_column[patch_id]), patch_id)
+            for patch_id, patch_category in enumerate(revised_subject_patch_table["patch_category"])
+            if patch_category == "PatchCategory.CleanFixFull"
+        )[1]
+
+
+    def _compute_baseline(self, revised_subject_patch_table):
         cnt = 0
-        for id in id_list:
+        for patch_category in revised_subject_patch_table["patch_category"]:
             cnt += 1
-            if revised_subject_patch_dict[id]["patch_category"] == "PatchCategory.CleanFixFull":
+            if patch_category == "PatchCategory.CleanFixFull":
                 return cnt
 
 
@@ -200,77 +341,395 @@ class PatchRerankerSamApproach:
         return False
 
 
+    def _get_cache_config(self):
+        # everything besides the input file that changes the result
+        cache_config = {
+            "reranker": SAM_APPROACH_V0_RERANKER,
+            "reranker_version": RERANKER_VERSION,
+            "formula": self._formula,
+            "matrix_type": self._matrix_type,
+            "modified_entity_level": self._modified_entity_level,
+            "patch_category_quality": self._patch_category_quality_dict,
+        }
+        if self._max_trials is not None:
+            cache_config["max_trials"] = self._max_trials
+
+        return cache_config
+
+
+    def get_cached_result(self, input_hash):
+        # (is_cached, result)
+        if self._result_cache is None:
+            return False, None
+
+        return self._result_cache.get(self._result_cache.get_key(input_hash, self._get_cache_config()))
+
+
+    def put_cached_result(self, input_hash, result):
+        if self._result_cache is None:
+            return
+
+        self._result_cache.put(self._result_cache.get_key(input_hash, self._get_cache_config()), result)
+
+
+    def get_store_config(self):
+        # what a result is queried by in the results store, see result_store.py
+        return build_store_config(
+            SAM_APPROACH_V0_RERANKER,
+            self._formula,
+            self._matrix_type,
+            self._modified_entity_level,
+            self._treat_nonfix_as_negtive,
+            self._max_trials,
+        )
+
+
+    def set_result_store(self, result_store):
+        # lets a sweep batch the results of all its configurations into one store
+        self._result_store = result_store
+
+
+    def write_result(self, project, version, result):
+        if result is None:
+            return
+
+        if self._result_store is not None:
+            self._result_store.add(project, version, self.get_store_config(), result)
+            return
+
+        output_filename = os.path.join(self._output_dir, "{}_{}.json".format(project, version))
+        with open(output_filename, 'w') as json_file:
+            json.dump(result, json_file, indent=4)
+
+
     def jit_patch_rerank(self, project_version_tuple):
         project, version = project_version_tuple
         print("processing {} - {} - {}".format(project, version, self._matrix_type))
 
-        json_file = os.path.join(self._data_dir, self._matrix_type, "{}_{}.json".format(project, version))
-        with open(json_file) as file:
-            repair_data = json.load(file)
+        data_file = os.path.join(
+            self._data_dir, self._matrix_type, "{}_{}{}".format(project, version, get_output_extension(self._data_format))
+        )
+
+        self._stage_timer.start_version("{}_{}".format(project, version))
+        with self._stage_timer.stage("cache"):
+            input_hash = get_file_hash(data_file) if self._result_cache is not None else None
+            is_cached, result = self.get_cached_result(input_hash)
+
+        if not is_cached:
+            if self._memory_map:
+                with self._stage_timer.stage("load"):
+                    mapped_matrix = VersionMatrix(data_file, "binary")
+                # closed even when the rerank raises, pool workers live for the whole run
+                with mapped_matrix:
+                    result = self.rerank_mapped_data(mapped_matrix)
+            else:
+                with self._stage_timer.stage("load"):
+                    repair_data = load_repair_data(data_file, self._data_format, [self._modified_entity_level])
+                result = self.rerank_repair_data(repair_data)
 
-        result = {}
+            self.put_cached_result(input_hash, result)
+
+        with self._stage_timer.stage("write"):
+            self.write_result(project, version, result)
+
+        # the results of the task reach the shard now, not when the pool worker exits
+        if self._result_store is not None:
+            self._result_store.flush()
+
+        # pool workers hand their records back to run_all
+        return self._stage_timer.pop_record_list()
+
+
+    def set_stage_timer(self, stage_timer):
+        # lets a sweep record all of its configurations into one StageTimer
+        self._stage_timer = stage_timer
+
+
+    def rerank_repair_data(self, repair_data, modified_entity_dict=None):
+        # repair_data is not modified, so one loaded version can be reranked under many configurations
         version_data = repair_data["patch"]
 
         if not self.doesIncludePlausibleFix(version_data):
-            return
+            return None
         
-        self.change_repair_data_level(repair_data)
+        with self._stage_timer.stage("revise"):
+            if modified_entity_dict is None:
+                modified_entity_dict = get_modified_entity_dict(repair_data, self._modified_entity_level)
 
-        revised_subject_patch_dict = self._revise_version_data(version_data)
-        baseline_rank = self._compute_baseline(revised_subject_patch_dict)
+            revised_subject_patch_table = self._revise_version_data(version_data, modified_entity_dict)
+        return self._rerank_patch_table(revised_subject_patch_table)
 
-        visited_patch_id_list = []
-        selected_candidate_id = self._get_validation_candidate(revised_subject_patch_dict)
-        self._update_subject_patch(revised_subject_patch_dict, selected_candidate_id)
 
-        selected_candidate_patch_category = revised_subject_patch_dict[selected_candidate_id]["patch_category"]
-        visited_patch_id_list.append(selected_candidate_id)
+    def rerank_mapped_data(self, mapped_matrix, modified_entity_column=None):
+        if "PatchCategory.CleanFixFull" not in mapped_matrix.get_column("patch_category"):
+            return None
 
-        while selected_candidate_patch_category != "PatchCategory.CleanFixFull":
-            selected_candidate_id = self._get_validation_candidate(revised_subject_patch_dict)
-            if selected_candidate_id != -1:
-                visited_patch_id_list.append(selected_candidate_id)
-            else:
-                assert len(visited_patch_id_list) == len(revised_subject_patch_dict.keys()), "error for checked all patches"
-                break
+        with self._stage_timer.stage("revise"):
+            if modified_entity_column is None:
+                modified_entity_column = get_modified_entity_column(mapped_matrix, self._modified_entity_level)
 
-            self._update_subject_patch(revised_subject_patch_dict, selected_candidate_id)
-            selected_candidate_patch_category = revised_subject_patch_dict[selected_candidate_id]["patch_category"]
+            revised_subject_patch_table = self._revise_mapped_data(mapped_matrix, modified_entity_column)
+        return self._rerank_patch_table(revised_subject_patch_table)
+
+
+    def _rerank_patch_table(self, revised_subject_patch_table):
+        result = {}
+        with self._stage_timer.stage("baseline"):
+            baseline_rank = self._compute_baseline(revised_subject_patch_table)
+        patch_id_column = revised_subject_patch_table["patch_id"]
+        patch_category_column = revised_subject_patch_table["patch_category"]
+
+        censored = False
+        # patches the loop validated, the closed-form tail excluded (iterations of the instrument report)
+        num_validated = 1
+        with self._stage_timer.stage("simulate"):
+            group_state = self._build_group_state(revised_subject_patch_table)
+            num_informative = sum(1 for patch_category in patch_category_column if self._is_informative(patch_category))
+
+            visited_patch_id_list = []
+            selected_candidate_id = self._get_validation_candidate(group_state)
+            self._update_subject_patch(revised_subject_patch_table, group_state, selected_candidate_id)
+
+            selected_candidate_patch_category = patch_category_column[selected_candidate_id]
+            visited_patch_id_list.append(patch_id_column[selected_candidate_id])
+            if self._is_informative(selected_candidate_patch_category):
+                num_informative -= 1
+
+            while selected_candidate_patch_category != "PatchCategory.CleanFixFull":
+                if self._max_trials is not None and len(visited_patch_id_list) >= self._max_trials:
+                    censored = True
+                    break
+
+                if self._is_order_fixed(group_state, num_informative):
+                    # the rest of the trajectory without scoring: the fix and the patches before it in the fixed order
+                    self._stage_timer.add_count("closed_form", 1)
+                    fix_patch_id = self._get_fixed_order_fix(revised_subject_patch_table, group_state)
+                    fixed_order_list = group_state.list_fixed_order_before(
+                        fix_patch_id, revised_subject_patch_table["modified_method"][fix_patch_id]
+                    ) + [fix_patch_id]
+                    if self._max_trials is not None and len(visited_patch_id_list) + len(fixed_order_list) > self._max_trials:
+                        censored = True
+                        fixed_order_list = fixed_order_list[:self._max_trials - len(visited_patch_id_list)]
+
+                    visited_patch_id_list += [patch_id_column[selected_candidate_id] for selected_candidate_id in fixed_order_list]
+                    self._stage_timer.add_count("closed_form_trials", len(fixed_order_list))
+                    break
+
+                selected_candidate_id = self._get_validation_candidate(group_state)
+                if selected_candidate_id != -1:
+                    visited_patch_id_list.append(patch_id_column[selected_candidate_id])
+                else:
+                    assert len(visited_patch_id_list) == len(patch_id_column), "error for checked all patches"
+                    break
+
+                self._update_subject_patch(revised_subject_patch_table, group_state, selected_candidate_id)
+                num_validated += 1
+                selected_candidate_patch_category = patch_category_column[selected_candidate_id]
+                if self._is_informative(selected_candidate_patch_category):
+                    num_informative -= 1
 
         num_trials = len(visited_patch_id_list)
+        self._stage_timer.add_count("iterations", num_validated)
 
         result = {
             "gt": baseline_rank,
             "eval": num_trials,
             "visited_patch_id_list": visited_patch_id_list,
         }
+        if self._max_trials is not None:
+            # censored: the fix was not reached within max_trials, eval is a lower bound
+            result["censored"] = censored
 
-        output_filename = os.path.join(self._output_dir, "{}_{}.json".format(project, version))
-        with open(output_filename, 'w') as json_file:
-            json.dump(result, json_file, indent=4)
+        return result
         
 
     def run_all(self):
         self.get_all_project_version_tuple()
         pool = multiprocessing.Pool(processes=self._num_threads)
-        pool.map(self.jit_patch_rerank, self.project_version_tuple_list)
+        record_list_list = pool.map(self.jit_patch_rerank, self.project_version_tuple_list)
+        pool.close()
+        pool.join()
         print(self._output_dir)
 
+        if self._stage_timer.enabled:
+            write_report(list(itertools.chain(*record_list_list)), self._output_dir + "_instrument_report.json")
+
+
+class PatchRerankerSweep:
+    # runs every (formula, matrix type, entity level, NoneFix policy) configuration,
+    # each version file is loaded once and reranked under all configurations of its matrix type
+    def __init__(
+        self,
+        data_dir,
+        output_dir,
+        formula_list=("Ochiai",),
+        matrix_type_list=("partial", "full"),
+        modified_entity_level_list=("class", "package", "method", "statement"),
+        treat_nonfix_as_negtive_list=(False,),
+        num_threads=6,
+        backend="dict",
+        data_format="json",
+        memory_map=False,
+        cache_dir=None,
+        result_store_dir=None,
+        max_trials=None,
+        instrument=False,
+    ):
+        self._data_dir = data_dir
+        self._output_dir = output_dir
+        # one StageTimer for the whole sweep, a version's record sums up all its configurations
+        self._stage_timer = StageTimer(instrument)
+        # one results store for the whole sweep, so a worker batches the results of all configurations
+        self._result_store = ResultStore(result_store_dir) if result_store_dir is not None else None
+        self._data_format = data_format
+        self._memory_map = memory_map
+        self._use_cache = cache_dir is not None
+        self._num_threads = num_threads
+
+        # matrix_type -> rerankers of all other configurations
+        self._reranker_dict = {}
+        for matrix_type in matrix_type_list:
+            self._reranker_dict[matrix_type] = []
+            for formula, modified_entity_level, treat_nonfix_as_negtive in itertools.product(
+                formula_list, modified_entity_level_list, treat_nonfix_as_negtive_list
+            ):
+                self._reranker_dict[matrix_type].append(PatchRerankerSamApproach(
+                    data_dir,
+                    self._get_output_dir(output_dir, formula, treat_nonfix_as_negtive),
+                    formula=formula,
+                    matrix_type=matrix_type,
+                    modified_entity_level=modified_entity_level,
+                    num_threads=num_threads,
+                    backend=backend,
+                    treat_nonfix_as_negtive=treat_nonfix_as_negtive,
+                    data_format=data_format,
+                    memory_map=memory_map,
+                    cache_dir=cache_dir,
+                    result_store_dir=result_store_dir,
+                    max_trials=max_trials,
+                ))
+                self._reranker_dict[matrix_type][-1].set_stage_timer(self._stage_timer)
+                self._reranker_dict[matrix_type][-1].set_result_store(self._result_store)
+
+
+    def _get_output_dir(self, output_dir, formula, treat_nonfix_as_negtive):
+        # the default configuration keeps the single-run layout: <output_dir>_<level>/<matrix_type>
+        if formula != "Ochiai":
+            output_dir = output_dir + "_{}".format(formula)
+
+        if treat_nonfix_as_negtive:
+            output_dir = output_dir + "_negnonfix"
+
+        return output_dir
+
+
+    def get_all_task_tuple(self):
+        # built fresh on every call, so run_all can be called again
+        task_tuple_list = []
+        for matrix_type, reranker_list in self._reranker_dict.items():
+            # an empty formula/level/policy list leaves nothing to rerank
+            if len(reranker_list) == 0:
+                continue
+
+            for project, version in reranker_list[0].get_all_project_version_tuple():
+                task_tuple_list.append((matrix_type, project, version))
+
+        return task_tuple_list
+
+
+    def sweep_version_i(self, task_tuple):
+        matrix_type, project, version = task_tuple
+        print("processing {} - {} - {}".format(project, version, matrix_type))
+
+        data_file = os.path.join(
+            self._data_dir, matrix_type, "{}_{}{}".format(project, version, get_output_extension(self._data_format))
+        )
+        reranker_list = self._reranker_dict[matrix_type]
+        self._stage_timer.start_version("{}_{}_{}".format(matrix_type, project, version))
+
+        # only configurations without a cached result need the version loaded
+        missing_reranker_list = []
+        with self._stage_timer.stage("cache"):
+            input_hash = get_file_hash(data_file) if self._use_cache else None
+            for reranker in reranker_list:
+                is_cached, result = reranker.get_cached_result(input_hash)
+                if is_cached:
+                    reranker.write_result(project, version, result)
+                else:
+                    missing_reranker_list.append(reranker)
+
+        if len(missing_reranker_list) == 0:
+            if self._result_store is not None:
+                self._result_store.flush()
+            return self._stage_timer.pop_record_list()
+
+        # mapped_matrix is closed even when a rerank raises, pool workers live for the whole run
+        with contextlib.ExitStack() as exit_stack:
+            with self._stage_timer.stage("load"):
+                if self._memory_map:
+                    mapped_matrix = exit_stack.enter_context(VersionMatrix(data_file, "binary"))
+                else:
+                    repair_data = load_repair_data(
+                        data_file, self._data_format, [reranker.get_modified_entity_level() for reranker in missing_reranker_list]
+                    )
+
+            # modified_entity_level -> modified_entity_dict (or column of mapped_matrix)
+            cached_entity_dict = {}
+            # the columns cut from mapped_matrix are dropped before it is closed
+            exit_stack.callback(cached_entity_dict.clear)
+            for reranker in missing_reranker_list:
+                modified_entity_level = reranker.get_modified_entity_level()
+                if self._memory_map:
+                    if modified_entity_level not in cached_entity_dict:
+                        with self._stage_timer.stage("revise"):
+                            cached_entity_dict[modified_entity_level] = get_modified_entity_column(mapped_matrix, modified_entity_level)
+
+                    result = reranker.rerank_mapped_data(mapped_matrix, cached_entity_dict[modified_entity_level])
+                else:
+                    if modified_entity_level not in cached_entity_dict:
+                        with self._stage_timer.stage("revise"):
+                            cached_entity_dict[modified_entity_level] = get_modified_entity_dict(repair_data, modified_entity_level)
+
+                    result = reranker.rerank_repair_data(repair_data, cached_entity_dict[modified_entity_level])
+
+                with self._stage_timer.stage("write"):
+                    reranker.put_cached_result(input_hash, result)
+                    reranker.write_result(project, version, result)
+
+        # the results of the task reach the shard now, not when the pool worker exits
+        if self._result_store is not None:
+            self._result_store.flush()
+
+        # pool workers hand their records back to run_all
+        return self._stage_timer.pop_record_list()
+
+
+    def run_all(self):
+        task_tuple_list = self.get_all_task_tuple()
+        pool = multiprocessing.Pool(processes=self._num_threads)
+        record_list_list = pool.map(self.sweep_version_i, task_tuple_list)
+        pool.close()
+        pool.join()
+
+        if self._stage_timer.enabled:
+            write_report(list(itertools.chain(*record_list_list)), self._output_dir + "_instrument_report.json")
+
 
 if __name__ == "__main__":
     data_dir = os.path.abspath("/filesystem/patch_ranking/ProflPartialMatrix/python/data/prapr/yiling_data/output")
     output_dir = os.path.abspath("eval")
 
-    for matrix_type_i in ["partial", "full"]:
-        for modified_entity_level_i in ["class", "package", "method", "statement"]:
-            start_time = time.time()
-            pr = PatchRerankerSamApproach(
-                data_dir,
-                output_dir,
-                formula="Ochiai",
-                matrix_type=matrix_type_i,
-                modified_entity_level=modified_entity_level_i,
-                num_threads=8,
-            )
-            pr.run_all()
-            print("--- {} mins ---".format((time.time() - start_time) / 60.0))
+    start_time = time.time()
+    sweep = PatchRerankerSweep(
+        data_dir,
+        output_dir,
+        formula_list=["Ochiai"],
+        matrix_type_list=["partial", "full"],
+        modified_entity_level_list=["class", "package", "method", "statement"],
+        treat_nonfix_as_negtive_list=[False],
+        num_threads=8,
+        cache_dir=os.path.abspath("rerank_cache"),
+        result_store_dir=os.path.abspath("rerank_results"),
+    )
+    sweep.run_all()
+    print("--- {} mins ---".format((time.time() - start_time) / 60.0))
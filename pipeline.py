@@ -0,0 +1,151 @@
+import queue
+import threading
+import functools
+
+
+# end of a stage's stream, tasks themselves may be anything (even None)
+DONE = object()
+
+
+class PipelineExecutor:
+    # read -> compute -> write for a list of tasks, with the stages of different tasks overlapping:
+    #   reader threads prefetch the inputs of the next tasks, at most max_prefetch read ahead
+    #   compute runs in the process pool, at most max_in_flight tasks handed to it at a time
+    #   writer threads flush the outputs, at most max_pending_write outputs waiting for them
+    # so at most max_prefetch + max_in_flight + max_pending_write tasks (plus one per thread) hold data
+    # read_func(task) and write_func(task, output) run in threads of this process and should be
+    # I/O bound, compute_func(task, data) is sent to the pool, so it must be picklable
+    # without a read_func the pool gets compute_func(task), without a write_func its output is returned
+    def __init__(
+        self,
+        pool,
+        read_func,
+        compute_func,
+        write_func,
+        num_readers=2,
+        num_writers=2,
+        max_prefetch=4,
+        max_in_flight=8,
+        max_pending_write=4,
+    ):
+        self._pool = pool
+        self._read_func = read_func
+        self._compute_func = compute_func
+        self._write_func = write_func
+        self._num_readers = num_readers
+        self._num_writers = num_writers
+        self._max_in_flight = max_in_flight
+
+        self._read_queue = queue.Queue(maxsize=max_prefetch)
+        self._write_queue = queue.Queue(maxsize=max_pending_write)
+        # write_func results, small and consumed as they come by run()
+        self._done_queue = queue.Queue()
+        self._in_flight_semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._task_iter = None
+        self._error = None
+
+
+    def _set_error(self, error):
+        # the first error wins, the stages stop taking new tasks but finish the started ones
+        with self._lock:
+            if self._error is None:
+                self._error = error
+
+
+    def _read_loop(self):
+        while self._error is None:
+            with self._lock:
+                task = next(self._task_iter, DONE)
+            if task is DONE:
+                break
+
+            try:
+                data = self._read_func(task) if self._read_func is not None else None
+            except Exception as error:
+                self._set_error(error)
+                break
+            self._read_queue.put((task, data))
+
+        self._read_queue.put(DONE)
+
+
+    def _dispatch_loop(self):
+        num_done_readers = 0
+        while num_done_readers < self._num_readers:
+            item = self._read_queue.get()
+            if item is DONE:
+                num_done_readers += 1
+                continue
+            if self._error is not None:
+                # keep draining, so no reader stays blocked on a full queue
+                continue
+
+            task, data = item
+            self._in_flight_semaphore.acquire()
+            self._pool.apply_async(
+                self._compute_func,
+                (task, data) if self._read_func is not None else (task,),
+                callback=functools.partial(self._on_computed, task),
+                error_callback=self._on_compute_error,
+            )
+
+        # every slot back means the pool has handed back every task
+        for _ in range(self._max_in_flight):
+            self._in_flight_semaphore.acquire()
+        for _ in range(self._num_writers):
+            self._write_queue.put(DONE)
+
+
+    def _on_computed(self, task, output):
+        # runs in the result thread of the pool, a full write queue holds back further results
+        self._write_queue.put((task, output))
+        self._in_flight_semaphore.release()
+
+
+    def _on_compute_error(self, error):
+        self._set_error(error)
+        self._in_flight_semaphore.release()
+
+
+    def _write_loop(self):
+        for task, output in iter(self._write_queue.get, DONE):
+            # outputs computed before an error are still written
+            try:
+                self._done_queue.put(self._write_func(task, output) if self._write_func is not None else output)
+            except Exception as error:
+                self._set_error(error)
+
+        self._done_queue.put(DONE)
+
+
+    def run(self, task_list):
+        # starts the stages right away, so the pool works on the tasks while the caller does
+        # something else; the returned iterator gives write_func(task, output) of every task in
+        # completion order and raises the first error of any stage once the started tasks are done
+        self._task_iter = iter(task_list)
+        self._error = None
+
+        thread_list = [threading.Thread(target=self._read_loop, daemon=True) for _ in range(self._num_readers)]
+        thread_list.append(threading.Thread(target=self._dispatch_loop, daemon=True))
+        thread_list += [threading.Thread(target=self._write_loop, daemon=True) for _ in range(self._num_writers)]
+        for thread in thread_list:
+            thread.start()
+
+        return self._iter_done(thread_list)
+
+
+    def _iter_done(self, thread_list):
+        num_done_writers = 0
+        while num_done_writers < self._num_writers:
+            item = self._done_queue.get()
+            if item is DONE:
+                num_done_writers += 1
+                continue
+            yield item
+
+        for thread in thread_list:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
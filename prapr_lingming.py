@@ -1,9 +1,11 @@
 from pprint import pprint
 # from parser.base import ParserBase
 import os
-import json
 import glob
 import gzip
+from matrix_format import dump_result, get_output_extension
+from entity_index import add_entity_index
+import xml.etree.ElementTree as ET
 
 import xmltodict
 
@@ -32,9 +34,11 @@ def get_patch_category(fp_len, pf_len, ff_len):
 
 
 class PraprParser():
-    def __init__(self, prapr_dir, output_dir):
+    def __init__(self, prapr_dir, output_dir, output_format="json"):
         self._prapr_dir = prapr_dir
         self._output_dir = os.path.join(output_dir)
+        # "json" (indent=4) or "binary" (see matrix_format.py)
+        self._output_format = output_format
         # self._Lang_version = [6, 7, 10, 22, 25, 26, 27, 31, 33, 39, 43, 44, 51, 57, 58, 59, 60, 61, 63]
         self._Lang_version = [6]
 
@@ -62,19 +66,41 @@ class PraprParser():
         return failing_test_set
 
 
-    def _read_prapr_report(self, version_id):
+    def _get_prapr_report_file(self, version_id):
         version_str = str(version_id)
         prapr_report_root = os.path.join(self._prapr_dir, version_str, "target", "prapr-reports")
         gz_file_list = glob.glob(os.path.join(prapr_report_root, "**", "*.gz"))
         assert len(gz_file_list) == 1, "find more prapr reports"
 
-        gz_file = gz_file_list[0]
-        input = gzip.open(gz_file, 'r')
-        prapr_dict = xmltodict.parse(input)
-        mutation_list = prapr_dict["mutations"]["mutation"]
+        return gz_file_list[0]
+
+
+    def _iter_mutation_xml(self, gz_file):
+        # stream <mutation> elements one by one, same fields as xmltodict would give
+        with gzip.open(gz_file, 'r') as input:
+            context = ET.iterparse(input, events=("start", "end"))
+            _, root = next(context)
+
+            for event, elem in context:
+                if event != "end" or elem.tag != "mutation":
+                    continue
+
+                mutation_i = {"@{}".format(key): value for key, value in elem.attrib.items()}
+                for child in elem:
+                    text = child.text.strip() if child.text is not None else ""
+                    mutation_i[child.tag] = text if len(text) > 0 else None
 
-        mutation_dict = {}
-        for id, mutation_i in enumerate(mutation_list):
+                yield mutation_i
+
+                # drop the consumed element so memory stays flat
+                elem.clear()
+                root.clear()
+
+
+    def _iter_prapr_report(self, version_id):
+        gz_file = self._get_prapr_report_file(version_id)
+
+        for id, mutation_i in enumerate(self._iter_mutation_xml(gz_file)):
             status = mutation_i["@status"]
             modified_method = "{}.{}{}".format(mutation_i["mutatedClass"], mutation_i["mutatedMethod"], mutation_i["methodDescription"])
             modified_line = mutation_i["lineNumber"]
@@ -87,15 +113,16 @@ class PraprParser():
             sorted_failed_tests = []
             sorted_passed_tests = []
 
+            failed_test_set = set(failed_tests)
             for test_i in executed_tests:
-                if test_i in failed_tests:
+                if test_i in failed_test_set:
                     sorted_failed_tests.append(test_i)
                 else:
                     sorted_passed_tests.append(test_i)
             
             sorted_executed_tests = sorted_failed_tests + sorted_passed_tests
 
-            mutation_dict[id] = {
+            yield id, {
                 "status": status,
                 "modified_method": modified_method,
                 "modified_line": modified_line,
@@ -105,7 +132,46 @@ class PraprParser():
                 "description": mutation_i["description"],
             }
 
-        return mutation_dict
+
+    def _read_prapr_report(self, version_id):
+        return dict(self._iter_prapr_report(version_id))
+
+
+    def _merge_patch(self, org_f_test_set, patch_content):
+        patch_f_test_set = set(patch_content["failed_tests"])
+
+        ff = org_f_test_set & patch_f_test_set
+        fp = org_f_test_set - ff
+        pf = patch_f_test_set - ff
+
+        ff_len = len(ff)
+        fp_len = len(fp)
+        pf_len = len(pf)
+
+        if patch_content["status"] in ['SURVIVED', 'KILLED']:
+            patch_category = get_patch_category(fp_len, pf_len, ff_len)
+        else:
+            patch_category = "PatchCategory." + patch_content["status"]
+
+        return {
+            "method": patch_content["modified_method"],
+            "line": int(patch_content["modified_line"]),
+            "pf_len": pf_len,
+            "ff_len": ff_len,
+            "fp_len": fp_len,
+            "patch_category": patch_category,
+            "mutator": patch_content["mutator"],
+            "description": patch_content["description"],
+        }
+
+
+    def _get_method_id_dict(self, modified_method_set):
+        modified_method_list = sorted(list(modified_method_set))
+        method_id_dict = {}
+        for id, method in enumerate(modified_method_list):
+            method_id_dict[method] = id
+
+        return method_id_dict
 
 
     def _merge_result(self, failing_tests, mutation_dict):
@@ -114,38 +180,10 @@ class PraprParser():
         modified_method_set = set()
 
         for patch_id, patch_content in mutation_dict.items():
-            patch_f_test_set = set(patch_content["failed_tests"])
-
-            ff = org_f_test_set & patch_f_test_set
-            fp = org_f_test_set - ff
-            pf = patch_f_test_set - ff
-
-            ff_len = len(ff)
-            fp_len = len(fp)
-            pf_len = len(pf)
-
-            if patch_content["status"] in ['SURVIVED', 'KILLED']:
-                patch_category = get_patch_category(fp_len, pf_len, ff_len)
-            else:
-                patch_category = "PatchCategory." + patch_content["status"]
-
-            merged_result_dict[patch_id] = {
-                "method": patch_content["modified_method"],
-                "line": int(patch_content["modified_line"]),
-                "pf_len": pf_len,
-                "ff_len": ff_len,
-                "fp_len": fp_len,
-                "patch_category": patch_category,
-                "mutator": patch_content["mutator"],
-                "description": patch_content["description"],
-            }
+            merged_result_dict[patch_id] = self._merge_patch(org_f_test_set, patch_content)
             modified_method_set.add(patch_content["modified_method"])
         
-        modified_method_list = sorted(list(modified_method_set))
-        method_id_dict = {}
-        for id, method in enumerate(modified_method_list):
-            method_id_dict[method] = id
-
+        method_id_dict = self._get_method_id_dict(modified_method_set)
         id_method_dict = {id: method for method, id in method_id_dict.items()}
         
         for patch_id, patch_content in merged_result_dict.items():
@@ -159,22 +197,55 @@ class PraprParser():
         return result
 
 
+    def _merge_result_stream(self, failing_tests, mutation_iter):
+        # full and partial results from one pass over the streamed mutations
+        org_f_test_set = set(failing_tests)
+        full_result_dict = {}
+        partial_result_dict = {}
+        modified_method_set = set()
+
+        for patch_id, patch_content in mutation_iter:
+            full_result_dict[patch_id] = self._merge_patch(org_f_test_set, patch_content)
+            self._truncate_patch_test_excution(patch_content)
+            partial_result_dict[patch_id] = self._merge_patch(org_f_test_set, patch_content)
+            modified_method_set.add(patch_content["modified_method"])
+
+        method_id_dict = self._get_method_id_dict(modified_method_set)
+        id_method_dict = {id: method for method, id in method_id_dict.items()}
+
+        result_list = []
+        for merged_result_dict in [full_result_dict, partial_result_dict]:
+            for patch_id, patch_content in merged_result_dict.items():
+                patch_content["method"] = method_id_dict[patch_content["method"]]
+
+            result_list.append({
+                "method": id_method_dict,
+                "patch": merged_result_dict
+            })
+
+        return result_list
+
+
+    def _truncate_patch_test_excution(self, patch_data):
+        if len(patch_data["failed_tests"]) > 0:
+            first_failed_test_id = patch_data["failed_tests"][0]
+            first_failed_test_idx = patch_data["executed_tests"].index(first_failed_test_id)
+            patch_data["executed_tests"] = patch_data["executed_tests"][: first_failed_test_idx + 1]
+
+
     def _truncate_test_excution(self, patch_dict):
         for _, patch_data in patch_dict.items():
-            if len(patch_data["failed_tests"]) > 0:
-                first_failed_test_id = patch_data["failed_tests"][0]
-                first_failed_test_idx = patch_data["executed_tests"].index(first_failed_test_id)
-                patch_data["executed_tests"] = patch_data["executed_tests"][: first_failed_test_idx + 1]
+            self._truncate_patch_test_excution(patch_data)
 
 
     def _run_project(self, version_id):
         failing_tests = self._parse_original_failing_tests(version_id)
 
-        mutation_dict = self._read_prapr_report(version_id)
-        full_result = self._merge_result(failing_tests, mutation_dict)
-
-        self._truncate_test_excution(mutation_dict)
-        partial_result = self._merge_result(failing_tests, mutation_dict)
+        full_result, partial_result = self._merge_result_stream(
+            failing_tests, self._iter_prapr_report(version_id)
+        )
+        # package/class/statement ids per patch, so rerankers can switch level without string processing
+        add_entity_index([full_result, partial_result])
 
         
         full_output_dir = os.path.join(self._output_dir, "full")
@@ -184,14 +255,12 @@ class PraprParser():
         os.makedirs(partial_output_dir, exist_ok=True)
 
         # Please change the output filename properly :)
-        full_output_filename = os.path.join(full_output_dir, "Lang_{}.json".format(version_id))
-        partial_output_filename = os.path.join(partial_output_dir, "Lang_{}.json".format(version_id))
+        output_extension = get_output_extension(self._output_format)
+        full_output_filename = os.path.join(full_output_dir, "Lang_{}{}".format(version_id, output_extension))
+        partial_output_filename = os.path.join(partial_output_dir, "Lang_{}{}".format(version_id, output_extension))
         
-        with open(full_output_filename, 'w') as json_file:
-            json.dump(full_result, json_file, indent=4)
-
-        with open(partial_output_filename, 'w') as json_file:
-            json.dump(partial_result, json_file, indent=4)
+        dump_result(full_result, full_output_filename, self._output_format)
+        dump_result(partial_result, partial_output_filename, self._output_format)
     
 
     def run_all_project(self):
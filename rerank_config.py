@@ -0,0 +1,25 @@
+# what the rerankers and make_table agree on, importable without the simulation (utils, numpy)
+
+# bump whenever the simulation changes, so cached results are recomputed
+RERANKER_VERSION = "1"
+
+# the two rerankers count trials differently, so their results never share a configuration
+SAM_APPROACH_RERANKER = "sam_approach_prapr"
+SAM_APPROACH_V0_RERANKER = "sam_approach_prapr_v0"
+
+
+def build_store_config(reranker, formula, matrix_type, modified_entity_level, treat_nonfix_as_negtive, max_trials=None):
+    # what a result is queried by in the results store, see result_store.py
+    # formula is the list of formulas of a formula_list run
+    store_config = {
+        "reranker": reranker,
+        "reranker_version": RERANKER_VERSION,
+        "formula": formula,
+        "matrix_type": matrix_type,
+        "modified_entity_level": modified_entity_level,
+        "treat_nonfix_as_negtive": treat_nonfix_as_negtive,
+    }
+    if max_trials is not None:
+        store_config["max_trials"] = max_trials
+
+    return store_config
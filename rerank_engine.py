@@ -0,0 +1,390 @@
+import bisect
+import heapq
+import itertools
+from utils import compute_score
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CandidateQueue:
+    # indexed max-priority queue with lazy deletion
+    # order: highest priority first, lowest key on ties (same as scanning sorted ids)
+    def __init__(self):
+        self._heap = []
+        # key -> current priority, only for keys still in the queue
+        self._priority_dict = {}
+
+
+    def __len__(self):
+        return len(self._priority_dict)
+
+
+    def __contains__(self, key):
+        return key in self._priority_dict
+
+
+    def push(self, key, priority):
+        # insert a new key or change the priority of an existing one
+        if key in self._priority_dict and self._priority_dict[key] == priority:
+            return
+
+        self._priority_dict[key] = priority
+        heapq.heappush(self._heap, (-priority, key))
+
+
+    def remove(self, key):
+        # the heap entries of the key become stale and are dropped in peek()
+        self._priority_dict.pop(key, None)
+
+
+    def peek(self):
+        while len(self._heap) > 0:
+            neg_priority, key = self._heap[0]
+            if key in self._priority_dict and self._priority_dict[key] == -neg_priority:
+                return key
+
+            heapq.heappop(self._heap)
+
+        return -1
+
+
+    def copy(self):
+        candidate_queue = CandidateQueue()
+        candidate_queue._heap = list(self._heap)
+        candidate_queue._priority_dict = dict(self._priority_dict)
+        return candidate_queue
+
+
+class EntityGroupState:
+    # reranking state kept per modified entity (method/class/package/statement) instead of per patch
+    # all unvalidated patches of one entity always share the same counters, so for entity e:
+    #   tp = 1 + GOOD validated in e,  fp = 1 + GOOD validated elsewhere
+    #   tn = 1 + BAD validated in e,   fn = 1 + BAD validated elsewhere
+    # "elsewhere" is the global GOOD/BAD count minus the count of e
+    def __init__(self, patch_entity_list):
+        # entity -> ascending ids of its patches
+        self._group_patch_dict = {}
+        for patch_id, entity in sorted(patch_entity_list):
+            if entity not in self._group_patch_dict:
+                self._group_patch_dict[entity] = []
+            self._group_patch_dict[entity].append(patch_id)
+
+        # entity -> index of its lowest unvalidated patch
+        self._head_idx_dict = {entity: 0 for entity in self._group_patch_dict}
+        self._good_dict = {entity: 0 for entity in self._group_patch_dict}
+        self._bad_dict = {entity: 0 for entity in self._group_patch_dict}
+        self._num_good = 0
+        self._num_bad = 0
+
+        self._priority_dict = {entity: 0.0 for entity in self._group_patch_dict}
+        # one entry per entity, keyed by the head patch id so ties go to the lowest patch id
+        self._candidate_queue = CandidateQueue()
+        for entity, patch_id_list in self._group_patch_dict.items():
+            self._candidate_queue.push(patch_id_list[0], 0.0)
+
+
+    def get_candidate(self):
+        return self._candidate_queue.peek()
+
+
+    def get_entity_list(self):
+        # entities that still have unvalidated patches
+        return list(self._priority_dict.keys())
+
+
+    def get_num_entities(self):
+        return len(self._priority_dict)
+
+
+    def get_priority(self, entity):
+        return self._priority_dict[entity]
+
+
+    def _iter_fixed_order_slices(self, patch_id, entity):
+        # as long as no priority changes, get_candidate() returns before patch_id all unvalidated
+        # patches of the entities with a higher priority and, for the entities with the same
+        # priority (the one of patch_id included), those with a lower patch id
+        priority = self._priority_dict[entity]
+        for other_entity, other_priority in self._priority_dict.items():
+            patch_id_list = self._group_patch_dict[other_entity]
+            head_idx = self._head_idx_dict[other_entity]
+            if other_priority > priority:
+                yield other_priority, patch_id_list, head_idx, len(patch_id_list)
+            elif other_priority == priority:
+                yield other_priority, patch_id_list, head_idx, bisect.bisect_left(patch_id_list, patch_id, head_idx)
+
+
+    def count_fixed_order_before(self, patch_id, entity):
+        return sum(end_idx - head_idx for _, _, head_idx, end_idx in self._iter_fixed_order_slices(patch_id, entity))
+
+
+    def list_fixed_order_before(self, patch_id, entity):
+        # the same patches in the order get_candidate() returns them: highest priority first, lowest patch id on ties
+        return [other_patch_id for _, other_patch_id in sorted(
+            (-priority, other_patch_id)
+            for priority, patch_id_list, head_idx, end_idx in self._iter_fixed_order_slices(patch_id, entity)
+            for other_patch_id in patch_id_list[head_idx:end_idx]
+        )]
+
+
+    def get_head_patch_id(self, entity):
+        # lowest unvalidated patch of the entity
+        return self._group_patch_dict[entity][self._head_idx_dict[entity]]
+
+
+    def get_counters(self, entity):
+        good = self._good_dict[entity]
+        bad = self._bad_dict[entity]
+        return 1 + good, 1 + self._num_good - good, 1 + bad, 1 + self._num_bad - bad
+
+
+    def validate(self, patch_id, entity, patch_quality):
+        patch_id_list = self._group_patch_dict[entity]
+        head_idx = self._head_idx_dict[entity]
+        assert patch_id_list[head_idx] == patch_id, "only the lowest unvalidated patch of an entity can be validated"
+
+        self._candidate_queue.remove(patch_id)
+        self._head_idx_dict[entity] = head_idx + 1
+
+        if head_idx + 1 < len(patch_id_list):
+            self._candidate_queue.push(patch_id_list[head_idx + 1], self._priority_dict[entity])
+        else:
+            self._priority_dict.pop(entity)
+
+        if patch_quality == "GOOD":
+            self._good_dict[entity] += 1
+            self._num_good += 1
+
+        if patch_quality == "BAD":
+            self._bad_dict[entity] += 1
+            self._num_bad += 1
+
+
+    def set_priority(self, entity, priority):
+        if priority == self._priority_dict[entity]:
+            return
+
+        self._priority_dict[entity] = priority
+        head_patch_id = self._group_patch_dict[entity][self._head_idx_dict[entity]]
+        self._candidate_queue.push(head_patch_id, priority)
+
+
+    def copy(self):
+        # independent state for a diverging simulation, the patch groups themselves are shared
+        group_state = EntityGroupState.__new__(EntityGroupState)
+        group_state._group_patch_dict = self._group_patch_dict
+        group_state._head_idx_dict = dict(self._head_idx_dict)
+        group_state._good_dict = dict(self._good_dict)
+        group_state._bad_dict = dict(self._bad_dict)
+        group_state._num_good = self._num_good
+        group_state._num_bad = self._num_bad
+        group_state._priority_dict = dict(self._priority_dict)
+        group_state._candidate_queue = self._candidate_queue.copy()
+        return group_state
+
+
+# counter values the vectorized formulas are checked on against utils.compute_score
+SCORE_PARITY_GRID = range(1, 13)
+# formula -> whether the vectorized formula gives exactly the floats of utils.compute_score
+_score_parity_dict = {}
+
+
+def _compute_formula_array(ef, nf, ep, np_, formula):
+    # the formulas of STATS on float64 arrays, None for any other formula
+    if formula == "Tarantula":
+        return (ef / (ef + nf)) / ((ef / (ef + nf)) + (ep / (ep + np_)))
+
+    if formula == "Ochiai":
+        return ef / np.sqrt((ef + nf) * (ef + ep))
+
+    if formula == "Ochiai2":
+        return (ef * np_) / np.sqrt((ef + ep) * (nf + np_) * (ef + np_) * (nf + ep))
+
+    if formula == "Op2":
+        return ef - ep / (ep + np_ + 1)
+
+    if formula == "SBI":
+        return 1 - ep / (ep + ef)
+
+    if formula == "Jaccard":
+        return ef / (ef + nf + ep)
+
+    if formula == "Kulczynski":
+        return ef / (nf + ep)
+
+    if formula == "Dstar2":
+        return (ef * ef) / (ep + nf)
+
+    return None
+
+
+def has_score_parity(formula):
+    # checked once per process and formula: any float difference would change the tie-breaking,
+    # so the numpy backend would no longer visit patches in the order of the dict backend
+    if formula not in _score_parity_dict:
+        counter_matrix = np.array(list(itertools.product(SCORE_PARITY_GRID, repeat=4)), dtype=np.int64)
+        score_array = _compute_formula_array(*counter_matrix.T.astype(np.float64), formula)
+        _score_parity_dict[formula] = score_array is not None and np.array_equal(
+            score_array,
+            np.array([compute_score(*counter_list, formula) for counter_list in counter_matrix.tolist()], dtype=np.float64),
+        )
+
+    return _score_parity_dict[formula]
+
+
+def _compute_unique_score_array(counter_array_list, formula):
+    # utils.compute_score once per distinct counter row, scattered back to every row
+    base = max(int(i.max()) for i in counter_array_list) + 1
+    if base ** 4 < 1 << 63:
+        # one int64 key per row, far cheaper to deduplicate than the rows themselves
+        key_array = np.zeros(len(counter_array_list[0]), dtype=np.int64)
+        for counter_array in counter_array_list:
+            key_array = key_array * base + counter_array
+        _, first_row_array, inverse_array = np.unique(key_array, return_index=True, return_inverse=True)
+    else:
+        _, first_row_array, inverse_array = np.unique(
+            np.stack(counter_array_list, axis=1), axis=0, return_index=True, return_inverse=True
+        )
+
+    unique_score_array = np.array(
+        [
+            compute_score(*[int(counter_array[row]) for counter_array in counter_array_list], formula)
+            for row in first_row_array
+        ],
+        dtype=np.float64,
+    )
+    return unique_score_array[inverse_array.reshape(-1)]
+
+
+def compute_score_array(true_positive, false_positive, true_negative, false_negative, formula):
+    # whole-array version of utils.compute_score, same convention: ef = tp, nf = fp, ep = tn, np = fn
+    # the vectorized formula is only used when it matched utils.compute_score exactly on the grid
+    counter_array_list = [np.asarray(i, dtype=np.int64) for i in [true_positive, false_positive, true_negative, false_negative]]
+    if len(counter_array_list[0]) == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    if has_score_parity(formula):
+        return _compute_formula_array(*[i.astype(np.float64) for i in counter_array_list], formula)
+
+    return _compute_unique_score_array(counter_array_list, formula)
+
+
+class NumpyEntityGroupState:
+    # array-backed EntityGroupState, one slot per entity
+    def __init__(self, patch_id_array, entity_array):
+        if np is None:
+            raise ImportError("numpy is required for the numpy rerank backend")
+
+        patch_id_array = np.asarray(patch_id_array, dtype=np.int64)
+        self._entity_value_array, entity_idx_array = np.unique(np.asarray(entity_array), return_inverse=True)
+
+        # patch ids grouped by entity, ascending inside each group
+        order = np.lexsort((patch_id_array, entity_idx_array))
+        self._grouped_patch_id_array = patch_id_array[order]
+        group_size_array = np.bincount(entity_idx_array, minlength=len(self._entity_value_array))
+        self._group_end_array = np.cumsum(group_size_array)
+        # per entity: position of its lowest unvalidated patch in _grouped_patch_id_array
+        self._head_array = self._group_end_array - group_size_array
+
+        num_entity = len(self._entity_value_array)
+        self._good_array = np.zeros(num_entity, dtype=np.int64)
+        self._bad_array = np.zeros(num_entity, dtype=np.int64)
+        self._num_good = 0
+        self._num_bad = 0
+
+        self._priority_array = np.zeros(num_entity, dtype=np.float64)
+        self._live_array = group_size_array > 0
+
+
+    def _get_entity_idx(self, entity):
+        return int(np.searchsorted(self._entity_value_array, entity))
+
+
+    def get_candidate(self):
+        if not self._live_array.any():
+            return -1
+
+        max_priority = self._priority_array[self._live_array].max()
+        candidate_mask = self._live_array & (self._priority_array == max_priority)
+        head_patch_id_array = self._grouped_patch_id_array[self._head_array[candidate_mask]]
+        return int(head_patch_id_array.min())
+
+
+    def get_num_entities(self):
+        return int(self._live_array.sum())
+
+
+    def get_priority(self, entity):
+        return float(self._priority_array[self._get_entity_idx(entity)])
+
+
+    def _get_fixed_order_before_mask(self, patch_id, entity):
+        # see EntityGroupState._iter_fixed_order_slices, one flag per position of _grouped_patch_id_array
+        priority = self._priority_array[self._get_entity_idx(entity)]
+        position_array = np.arange(len(self._grouped_patch_id_array))
+        entity_idx_array = np.searchsorted(self._group_end_array, position_array, side="right")
+        entity_priority_array = self._priority_array[entity_idx_array]
+        return (position_array >= self._head_array[entity_idx_array]) & (
+            (entity_priority_array > priority)
+            | ((entity_priority_array == priority) & (self._grouped_patch_id_array < patch_id))
+        ), entity_priority_array
+
+
+    def count_fixed_order_before(self, patch_id, entity):
+        before_mask, _ = self._get_fixed_order_before_mask(patch_id, entity)
+        return int(before_mask.sum())
+
+
+    def list_fixed_order_before(self, patch_id, entity):
+        before_mask, entity_priority_array = self._get_fixed_order_before_mask(patch_id, entity)
+        patch_id_array = self._grouped_patch_id_array[before_mask]
+        order = np.lexsort((patch_id_array, -entity_priority_array[before_mask]))
+        return patch_id_array[order].tolist()
+
+
+    def get_counter_arrays(self):
+        return (
+            1 + self._good_array,
+            1 + self._num_good - self._good_array,
+            1 + self._bad_array,
+            1 + self._num_bad - self._bad_array,
+        )
+
+
+    def validate(self, patch_id, entity, patch_quality):
+        entity_idx = self._get_entity_idx(entity)
+        head_idx = self._head_array[entity_idx]
+        assert self._grouped_patch_id_array[head_idx] == patch_id, "only the lowest unvalidated patch of an entity can be validated"
+
+        self._head_array[entity_idx] = head_idx + 1
+        self._live_array[entity_idx] = head_idx + 1 < self._group_end_array[entity_idx]
+
+        if patch_quality == "GOOD":
+            self._good_array[entity_idx] += 1
+            self._num_good += 1
+
+        if patch_quality == "BAD":
+            self._bad_array[entity_idx] += 1
+            self._num_bad += 1
+
+
+    def set_priority_array(self, priority_array):
+        self._priority_array = priority_array
+
+
+    def copy(self):
+        group_state = NumpyEntityGroupState.__new__(NumpyEntityGroupState)
+        group_state._entity_value_array = self._entity_value_array
+        group_state._grouped_patch_id_array = self._grouped_patch_id_array
+        group_state._group_end_array = self._group_end_array
+        group_state._head_array = self._head_array.copy()
+        group_state._good_array = self._good_array.copy()
+        group_state._bad_array = self._bad_array.copy()
+        group_state._num_good = self._num_good
+        group_state._num_bad = self._num_bad
+        group_state._priority_array = self._priority_array.copy()
+        group_state._live_array = self._live_array.copy()
+        return group_state
@@ -0,0 +1,42 @@
+import os
+import json
+import hashlib
+
+
+class ResultCache:
+    # content-addressed store of rerank results: <cache_dir>/<key[:2]>/<key>.json
+    # the key hashes the input file content together with the configuration and code version
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+
+    def get_key(self, input_hash, config_dict):
+        key_str = json.dumps({"input": input_hash, "config": config_dict}, sort_keys=True)
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+    def _get_filename(self, key):
+        return os.path.join(self._cache_dir, key[:2], "{}.json".format(key))
+
+
+    def get(self, key):
+        # (True, result) on a hit, result may be None for versions that were skipped
+        filename = self._get_filename(key)
+        if not os.path.exists(filename):
+            return False, None
+
+        with open(filename) as file:
+            return True, json.load(file)["result"]
+
+
+    def put(self, key, result):
+        filename = self._get_filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # write then rename, so a concurrent reader never sees a partial entry
+        tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmp_filename, "w") as json_file:
+            json.dump({"result": result}, json_file)
+
+        os.replace(tmp_filename, filename)
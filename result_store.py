@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import platform
+from multiprocessing.util import Finalize
+
+
+def match_config(config_dict, config_filter):
+    return all(config_dict.get(key) == value for key, value in config_filter.items())
+
+
+def _append_line_list(store_dir, line_list):
+    # one append per batch, a reader never sees a partial line of a finished batch
+    # the shard is opened per batch and closed right away, a forked pool worker gets its own shard
+    if len(line_list) == 0:
+        return
+
+    shard_filename = os.path.join(store_dir, "results_{}_{}.jsonl".format(platform.node(), os.getpid()))
+    with open(shard_filename, "a") as shard_file:
+        shard_file.write("".join(line_list))
+    # emptied in place, the backstop of add() holds the same list
+    del line_list[:]
+
+
+class ResultStore:
+    # append-only rerank results: <store_dir>/results_<host>_<pid>.jsonl, one shard per process
+    # a line is {"project", "version", "config", "result", "created"}, the latest line of a
+    # (project, version, config) wins, so rerunning a configuration needs no cleanup
+    # the rerankers flush at the end of every task, so a terminated pool only loses the running tasks
+    def __init__(self, store_dir, batch_size=256):
+        self._store_dir = store_dir
+        self._batch_size = batch_size
+        self._line_list = []
+        self._finalize_pid = None
+        os.makedirs(self._store_dir, exist_ok=True)
+
+
+    def add(self, project, version, config_dict, result):
+        if self._finalize_pid != os.getpid():
+            # backstop for lines nobody flushed, appended when the store is collected or the process exits;
+            # the callback holds no reference to the store, so it does not keep every unpickled copy alive
+            self._finalize_pid = os.getpid()
+            Finalize(self, _append_line_list, args=(self._store_dir, self._line_list), exitpriority=10)
+
+        self._line_list.append(json.dumps({
+            "project": project,
+            "version": version,
+            "config": config_dict,
+            "result": result,
+            "created": time.time(),
+        }) + "\n")
+
+        if len(self._line_list) >= self._batch_size:
+            self.flush()
+
+
+    def flush(self):
+        _append_line_list(self._store_dir, self._line_list)
+
+
+    def get_shard_filename_list(self):
+        return sorted(
+            os.path.join(self._store_dir, i) for i in os.listdir(self._store_dir) if i.endswith(".jsonl")
+        )
+
+
+    def iter_record(self, **config_filter):
+        # latest record of every (project, version, config) whose config has all the given values,
+        # e.g. iter_record(matrix_type="partial", modified_entity_level="method")
+        record_dict = {}
+        for shard_filename in self.get_shard_filename_list():
+            with open(shard_filename) as shard_file:
+                for line in shard_file:
+                    if not line.endswith("\n"):
+                        # batch still being written
+                        break
+
+                    record = json.loads(line)
+                    if not match_config(record["config"], config_filter):
+                        continue
+
+                    record_key = (record["project"], record["version"], json.dumps(record["config"], sort_keys=True))
+                    if record_key not in record_dict or record_dict[record_key]["created"] <= record["created"]:
+                        record_dict[record_key] = record
+
+        return iter(record_dict.values())
+
+
+    def iter_result(self, **config_filter):
+        # (project, version, result) like make_table.iter_json_result
+        for record in self.iter_record(**config_filter):
+            yield record["project"], record["version"], record["result"]
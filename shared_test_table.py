@@ -0,0 +1,170 @@
+import io
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+
+# compact test table of one version, one flat buffer that can live in shared memory:
+#   header int32[4] = num_tests, name bytes, result bytes, 0
+#   test_id int32[n] | name offsets int32[n + 1] | result offsets int32[n + 1] | names (utf-8) | results (utf-8)
+# rows keep the order of the testLog
+INT_TYPECODE = "i"
+HEADER_SIZE = 4
+
+
+def _encode_string_column(string_list):
+    offset_column = array(INT_TYPECODE, [0])
+    encoded_list = []
+    for string in string_list:
+        encoded = string.encode("utf-8")
+        encoded_list.append(encoded)
+        offset_column.append(offset_column[-1] + len(encoded))
+
+    return offset_column, b"".join(encoded_list)
+
+
+def attach_shared_memory(name):
+    # the creating process owns the block, so attaching must not register it with a resource
+    # tracker: the tracker of a worker would unlink it (and warn) when the worker exits, and
+    # undoing the registration afterwards breaks the creator's own one when both share a tracker
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class TestTable:
+    def __init__(self, buffer, shm=None):
+        # buffer: bytes-like in the layout above, shm: the SharedMemory it lives in (if any)
+        self._shm = shm
+        self._buffer = memoryview(buffer)
+        itemsize = array(INT_TYPECODE).itemsize
+
+        header = self._buffer[:HEADER_SIZE * itemsize].cast(INT_TYPECODE)
+        num_tests, name_len, result_len = header[0], header[1], header[2]
+        header.release()
+
+        offset = HEADER_SIZE * itemsize
+        column_list = []
+        for column_len in [num_tests, num_tests + 1, num_tests + 1]:
+            column_list.append(self._buffer[offset:offset + column_len * itemsize].cast(INT_TYPECODE))
+            offset += column_len * itemsize
+        self._test_id_column, self._name_offset_column, self._result_offset_column = column_list
+
+        self._name_bytes = self._buffer[offset:offset + name_len]
+        self._result_bytes = self._buffer[offset + name_len:offset + name_len + result_len]
+        self._row_dict = None
+
+
+    @classmethod
+    def from_test_log(cls, test_log_filename):
+        with open(test_log_filename) as file:
+            return cls.from_test_log_lines(file)
+
+
+    @classmethod
+    def from_test_log_bytes(cls, data):
+        # content of a testLog read in binary mode, decoded like open() in text mode would
+        return cls.from_test_log_lines(io.TextIOWrapper(io.BytesIO(data)))
+
+
+    @classmethod
+    def from_test_log_lines(cls, line_iter):
+        test_id_column = array(INT_TYPECODE)
+        test_name_list = []
+        test_result_list = []
+
+        for line in line_iter:
+            test_name, test_id, test_result = line.rstrip("\n").split(" ")
+            test_id_column.append(int(test_id))
+            test_name_list.append(test_name)
+            test_result_list.append(test_result)
+
+        name_offset_column, name_bytes = _encode_string_column(test_name_list)
+        result_offset_column, result_bytes = _encode_string_column(test_result_list)
+        header = array(INT_TYPECODE, [len(test_id_column), len(name_bytes), len(result_bytes), 0])
+
+        return cls(b"".join([
+            header.tobytes(),
+            test_id_column.tobytes(),
+            name_offset_column.tobytes(),
+            result_offset_column.tobytes(),
+            name_bytes,
+            result_bytes,
+        ]))
+
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        shm = attach_shared_memory(name)
+        return cls(shm.buf, shm)
+
+
+    def to_shared_memory(self):
+        # the caller owns the block: close() and unlink() it once every worker is done
+        shm = shared_memory.SharedMemory(create=True, size=max(len(self._buffer), 1))
+        shm.buf[:len(self._buffer)] = self._buffer
+        return shm
+
+
+    def __len__(self):
+        return len(self._test_id_column)
+
+
+    def get_test_id(self, row):
+        return self._test_id_column[row]
+
+
+    def get_test(self, row):
+        return bytes(self._name_bytes[self._name_offset_column[row]:self._name_offset_column[row + 1]]).decode("utf-8")
+
+
+    def get_test_result(self, row):
+        return bytes(self._result_bytes[self._result_offset_column[row]:self._result_offset_column[row + 1]]).decode("utf-8")
+
+
+    def _get_row_dict(self):
+        # test_id -> row, ordered by first appearance, a test id listed twice resolves to its last
+        # row (exactly the dict the parser used to build)
+        if self._row_dict is None:
+            self._row_dict = {test_id: row for row, test_id in enumerate(self._test_id_column)}
+        return self._row_dict
+
+
+    def get_row(self, test_id):
+        return self._get_row_dict()[test_id]
+
+
+    def items(self):
+        # (test_id, test name, test result) per distinct test id
+        for test_id, row in self._get_row_dict().items():
+            yield test_id, self.get_test(row), self.get_test_result(row)
+
+
+    def get_result_dict(self):
+        # test_id -> test result
+        return {test_id: test_result for test_id, _, test_result in self.items()}
+
+
+    def to_dict(self):
+        # the "test" table of the parsed output: test_id -> {"test", "test_result"}
+        test_dict = {}
+        for test_id, test_name, test_result in self.items():
+            test_dict[test_id] = {
+                "test": test_name,
+                "test_result": test_result,
+            }
+
+        return test_dict
+
+
+    def close(self):
+        for view in [self._test_id_column, self._name_offset_column, self._result_offset_column, self._name_bytes, self._result_bytes, self._buffer]:
+            view.release()
+        if self._shm is not None:
+            self._shm.close()
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import contextlib
+
+import pytest
+
+# the parsers and rerankers are top-level scripts of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# compute_score is not part of the repository
+utils = pytest.importorskip("utils")
+
+from benchmarks.generate import generate_prapr_log, generate_prapr_report
+import PraPR_parser_v1_multi_core
+import prapr_lingming
+import patch_rerank_sam_approach_prapr
+import patch_rerank_sam_approach_prapr_v0
+
+
+# the quality tables of the original loops, spelled out so the check does not depend on
+# the module globals (patch_rerank_sam_approach_prapr rewrites its own for treat_nonfix_as_negtive=False)
+# a category missing here (PatchCategory.TIMED_OUT) raises KeyError once such a patch is validated
+QUALITY_DICT = {
+    'PatchCategory.NegFix': "BAD",
+    'PatchCategory.NoneFix': "BAD",
+    '': "None",
+    'PatchCategory.NoisyFixPartial': "GOOD",
+    'PatchCategory.NoisyFixFull': "GOOD",
+    'PatchCategory.CleanFixPartial': "GOOD",
+    'PatchCategory.CleanFixFull': "GOOD",
+}
+V0_QUALITY_DICT = dict(QUALITY_DICT, **{
+    'PatchCategory.NoneFix': "None",
+    '': "BAD",
+})
+
+PROJECT = "Bench"
+# (version, seed), version 3 has no patch at all
+VERSION_SEED_LIST = [(1, 1), (2, 4), (3, None)]
+LINGMING_VERSION = 6
+LINGMING_SEED = 6
+MATRIX_TYPE_LIST = ["full", "partial"]
+LEVEL_LIST = ["method", "class", "package", "statement"]
+FORMULA = "Ochiai"
+READ_OPTION_LIST = [
+    ("dict", "json", False),
+    ("dict", "binary", False),
+    ("dict", "binary", True),
+    ("numpy", "json", False),
+    ("numpy", "binary", False),
+    ("numpy", "binary", True),
+]
+
+
+def get_entity(method, line, method_id, modified_entity_level):
+    if modified_entity_level == "method":
+        return method_id
+    if modified_entity_level == "statement":
+        return "{}_{}".format(method_id, line)
+
+    # "<class>:<method>(<desc>)" in the mutant logs, "<class>.<method>(<desc>)" in the prapr reports
+    if ":" in method:
+        clazz = method.split(":")[0]
+    else:
+        clazz = method.split("(")[0].rsplit(".", 1)[0]
+    if modified_entity_level == "class":
+        return clazz
+    return ".".join(clazz.split(".")[:-1])
+
+
+def baseline_rerank(repair_data, modified_entity_level, quality_dict, trials_per_step):
+    # the loop of the original scripts: validate the first patch with the highest priority,
+    # update every unvalidated patch, stop at the first CleanFixFull
+    # returns None for a version without a CleanFixFull, no result is written for it
+    patch_dict = {}
+    for patch_id, patch_data in repair_data["patch"].items():
+        method_id = patch_data["method"]
+        patch_dict[int(patch_id)] = {
+            "entity": get_entity(repair_data["method"][str(method_id)], patch_data["line"], method_id, modified_entity_level),
+            "patch_category": patch_data["patch_category"],
+            "counts": [1, 1, 1, 1],
+            "priority": 0.0,
+            "validated": False,
+        }
+
+    id_list = sorted(patch_dict.keys())
+    fix_id_list = [i for i in id_list if patch_dict[i]["patch_category"] == "PatchCategory.CleanFixFull"]
+    if len(fix_id_list) == 0:
+        return None
+
+    visited_patch_id_list = []
+    while True:
+        candidate_id_list = [i for i in id_list if not patch_dict[i]["validated"]]
+        if len(candidate_id_list) == 0:
+            break
+        selected_id = max(candidate_id_list, key=lambda i: (patch_dict[i]["priority"], -i))
+        visited_patch_id_list.append(selected_id)
+
+        selected_patch = patch_dict[selected_id]
+        selected_patch["validated"] = True
+        selected_quality = quality_dict[selected_patch["patch_category"]]
+        cached_score = {}
+        for patch in patch_dict.values():
+            if patch["validated"]:
+                continue
+            is_match = patch["entity"] == selected_patch["entity"]
+            if selected_quality == "GOOD":
+                patch["counts"][0 if is_match else 1] += 1
+            if selected_quality == "BAD":
+                patch["counts"][2 if is_match else 3] += 1
+            if patch["entity"] not in cached_score:
+                cached_score[patch["entity"]] = utils.compute_score(*patch["counts"], FORMULA)
+            patch["priority"] = cached_score[patch["entity"]]
+
+        if selected_patch["patch_category"] == "PatchCategory.CleanFixFull":
+            break
+
+    return {
+        "gt": id_list.index(fix_id_list[0]) + 1,
+        "eval": trials_per_step * len(visited_patch_id_list) - (trials_per_step - 1),
+        "visited_patch_id_list": visited_patch_id_list,
+    }
+
+
+@pytest.fixture(scope="module")
+def data_dir_dict(tmp_path_factory):
+    # data_format -> parsed data dir holding the generated mutant log versions and a prapr report version
+    root_dir = tmp_path_factory.mktemp("rerank")
+    log_dir = str(root_dir / "log")
+    for version, seed in VERSION_SEED_LIST:
+        generate_prapr_log(log_dir, PROJECT, version, num_patches=300, num_tests=60, num_methods=12, seed=seed or 0)
+        if seed is None:
+            open(os.path.join(log_dir, PROJECT, "{}_mutantlog".format(version)), "w").close()
+    report_dir = str(root_dir / "report")
+    generate_prapr_report(report_dir, LINGMING_VERSION, num_patches=300, num_tests=60, num_methods=20, seed=LINGMING_SEED)
+
+    data_dir_dict = {}
+    for data_format in ["json", "binary"]:
+        data_dir = str(root_dir / "parsed_{}".format(data_format))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            PraPR_parser_v1_multi_core.PraPRParser(
+                log_dir, data_dir, project_list=[PROJECT], num_cores=2, output_format=data_format,
+            ).process_all()
+            prapr_lingming.PraprParser(report_dir, data_dir, output_format=data_format).run_all_project()
+        data_dir_dict[data_format] = data_dir
+
+    return data_dir_dict
+
+
+def get_project_version_list():
+    return [(PROJECT, str(version)) for version, _ in VERSION_SEED_LIST] + [("Lang", str(LINGMING_VERSION))]
+
+
+def run_reranker(reranker, project_version_tuple):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        reranker.jit_patch_rerank(project_version_tuple)
+
+    result_file = os.path.join(reranker._output_dir, "{}_{}.json".format(*project_version_tuple))
+    if not os.path.exists(result_file):
+        return None
+    with open(result_file) as file:
+        return json.load(file)
+
+
+def load_json_data(data_dir_dict, matrix_type, project_version_tuple):
+    with open(os.path.join(data_dir_dict["json"], matrix_type, "{}_{}.json".format(*project_version_tuple))) as file:
+        return json.load(file)
+
+
+def test_baseline_covers_all_cases(data_dir_dict):
+    # the generated versions include a TIMED_OUT patch, a version without patches and ranks past the first trial
+    repair_data = load_json_data(data_dir_dict, "partial", ("Lang", str(LINGMING_VERSION)))
+    assert "PatchCategory.TIMED_OUT" in [i["patch_category"] for i in repair_data["patch"].values()]
+    assert len(load_json_data(data_dir_dict, "partial", (PROJECT, "3"))["patch"]) == 0
+
+    expected = baseline_rerank(load_json_data(data_dir_dict, "partial", (PROJECT, "1")), "method", V0_QUALITY_DICT, 1)
+    assert expected["eval"] > 1
+
+
+@pytest.mark.parametrize("backend, data_format, memory_map", READ_OPTION_LIST)
+def test_v0_reranker_matches_baseline(data_dir_dict, tmp_path, backend, data_format, memory_map):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+
+    for matrix_type in MATRIX_TYPE_LIST:
+        for modified_entity_level in LEVEL_LIST:
+            reranker = patch_rerank_sam_approach_prapr_v0.PatchRerankerSamApproach(
+                data_dir_dict[data_format],
+                str(tmp_path / "eval"),
+                formula=FORMULA,
+                matrix_type=matrix_type,
+                modified_entity_level=modified_entity_level,
+                num_threads=1,
+                backend=backend,
+                data_format=data_format,
+                memory_map=memory_map,
+            )
+            for project_version_tuple in get_project_version_list():
+                expected = baseline_rerank(
+                    load_json_data(data_dir_dict, matrix_type, project_version_tuple),
+                    modified_entity_level, V0_QUALITY_DICT, 1,
+                )
+                result = run_reranker(reranker, project_version_tuple)
+
+                if expected is None:
+                    assert result is None, (matrix_type, modified_entity_level, project_version_tuple)
+                    continue
+                assert result is not None, (matrix_type, modified_entity_level, project_version_tuple)
+                assert [result["gt"], result["eval"], result["visited_patch_id_list"]] == [
+                    expected["gt"], expected["eval"], expected["visited_patch_id_list"]
+                ], (matrix_type, modified_entity_level, project_version_tuple)
+
+
+@pytest.mark.parametrize("backend, data_format, memory_map", READ_OPTION_LIST)
+def test_reranker_matches_baseline(data_dir_dict, tmp_path, backend, data_format, memory_map):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+
+    for matrix_type in MATRIX_TYPE_LIST:
+        reranker = patch_rerank_sam_approach_prapr.PatchRerankerSamApproach(
+            data_dir_dict[data_format],
+            str(tmp_path / "eval"),
+            formula=FORMULA,
+            matrix_type=matrix_type,
+            num_threads=1,
+            backend=backend,
+            data_format=data_format,
+            memory_map=memory_map,
+        )
+        for project_version_tuple in get_project_version_list():
+            # every validated patch but the first one is counted twice
+            expected = baseline_rerank(
+                load_json_data(data_dir_dict, matrix_type, project_version_tuple),
+                "method", QUALITY_DICT, 2,
+            )
+            result = run_reranker(reranker, project_version_tuple)
+
+            if expected is None:
+                assert result is None, (matrix_type, project_version_tuple)
+                continue
+            assert result is not None, (matrix_type, project_version_tuple)
+            assert [result["gt"], result["eval"]] == [expected["gt"], expected["eval"]], (matrix_type, project_version_tuple)
@@ -0,0 +1,200 @@
+import os
+import json
+import mmap
+from matrix_format import MappedMatrix, get_output_extension
+
+
+# json written by dump_result (indent=4): every top-level key starts a line with 4 spaces,
+# every entry of a top-level dict one with 8, and a raw newline never occurs inside a string
+TOP_LEVEL_KEY_PREFIX = b'\n    "'
+ENTRY_KEY_PREFIX = b'\n        "'
+
+
+class JsonSectionReader:
+    # top-level sections of a json object file, located by a scan for their key lines and only
+    # parsed when asked for; files in any other layout are loaded whole on first use
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(filename) > 0 else b""
+        # name -> (value start, value end) in the file, None until indexed
+        self._section_range_dict = None
+        # whole object when the layout is not the indented one
+        self._data = None
+        self._index_section()
+
+
+    def _index_section(self):
+        line_start_list = []
+        pos = self._mmap.find(TOP_LEVEL_KEY_PREFIX)
+        while pos != -1:
+            line_start_list.append(pos + 1)
+            pos = self._mmap.find(TOP_LEVEL_KEY_PREFIX, pos + 1)
+
+        object_end = self._mmap.rfind(b"}")
+        if len(line_start_list) == 0 or object_end == -1:
+            self._data = json.loads(bytes(self._mmap))
+            return
+
+        decoder = json.JSONDecoder()
+        self._section_range_dict = {}
+        for line_start, next_line_start in zip(line_start_list, line_start_list[1:] + [object_end]):
+            line = self._mmap[line_start:self._mmap.find(b"\n", line_start)].decode("utf-8")
+            name, key_end = decoder.raw_decode(line, 4)
+            # skip ': ', the value runs up to the comma before the next key
+            value_start = line_start + len(line[:key_end].encode("utf-8")) + 2
+            self._section_range_dict[name] = (value_start, next_line_start)
+
+
+    def get_section_name_list(self):
+        if self._data is not None:
+            return list(self._data.keys())
+        return list(self._section_range_dict.keys())
+
+
+    def has_section(self, name):
+        if self._data is not None:
+            return name in self._data
+        return name in self._section_range_dict
+
+
+    def get_section(self, name):
+        if self._data is not None:
+            return self._data[name]
+
+        start, end = self._section_range_dict[name]
+        return json.loads(self._mmap[start:end].rstrip().rstrip(b","))
+
+
+    def iter_section_item(self, name):
+        # (key, value) of a dict section one entry at a time, the section is never parsed whole
+        if self._data is not None:
+            yield from self._data[name].items()
+            return
+
+        start, end = self._section_range_dict[name]
+        entry_start = self._mmap.find(ENTRY_KEY_PREFIX, start, end)
+        while entry_start != -1:
+            next_entry_start = self._mmap.find(ENTRY_KEY_PREFIX, entry_start + 1, end)
+            entry_end = next_entry_start if next_entry_start != -1 else self._mmap.rfind(b"\n    }", entry_start, end)
+            entry = self._mmap[entry_start:entry_end].strip().rstrip(b",")
+            yield next(iter(json.loads(b"{" + entry + b"}").items()))
+            entry_start = next_entry_start
+
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+
+class VersionMatrix:
+    # read-only view of one parsed version (json or binary output of the parsers):
+    # tables (method, test, package, ...) are loaded when first asked for, patches can be
+    # projected to a few fields and iterated without loading the whole file
+    def __init__(self, filename, data_format="json", test_filename=None):
+        self._data_format = data_format
+        # sidecar test table (PraPRParser test_output="sidecar"), used when the file has none
+        self._test_filename = test_filename
+        self._table_dict = {}
+
+        if data_format == "binary":
+            self._mapped_matrix = MappedMatrix(filename)
+            self._reader = None
+        else:
+            self._mapped_matrix = None
+            self._reader = JsonSectionReader(filename)
+
+
+    @classmethod
+    def from_output_dir(cls, output_dir, matrix_type, project, version, data_format="json"):
+        # <output_dir>/<matrix_type>/<project>_<version>.json|.bin, see PraPRParser
+        filename = os.path.join(output_dir, matrix_type, "{}_{}{}".format(project, version, get_output_extension(data_format)))
+        test_filename = os.path.join(output_dir, "test", "{}_{}.json".format(project, version))
+        return cls(filename, data_format, test_filename if os.path.exists(test_filename) else None)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __len__(self):
+        if self._mapped_matrix is not None:
+            return len(self._mapped_matrix)
+        return sum(1 for _ in self._reader.iter_section_item("patch"))
+
+
+    def get_table(self, name):
+        if name not in self._table_dict:
+            if self._mapped_matrix is not None and self._mapped_matrix.has_table(name):
+                self._table_dict[name] = self._mapped_matrix.get_table(name)
+            elif self._reader is not None and self._reader.has_section(name):
+                self._table_dict[name] = self._reader.get_section(name)
+            elif name == "test" and self._test_filename is not None:
+                with open(self._test_filename) as file:
+                    self._table_dict[name] = json.load(file)
+            else:
+                raise KeyError(name)
+
+        return self._table_dict[name]
+
+
+    def get_field_list(self):
+        # per-patch fields, patch_id excluded
+        if self._mapped_matrix is not None:
+            return self._mapped_matrix.get_column_name_list()[1:]
+
+        for _, patch_data in self._reader.iter_section_item("patch"):
+            return list(patch_data.keys())
+        return []
+
+
+    def has_column(self, name):
+        return name == "patch_id" or name in self.get_field_list()
+
+
+    def get_column(self, name):
+        # row-aligned with the patches of the file; int32 view or StringColumn for binary files
+        if self._mapped_matrix is not None:
+            return self._mapped_matrix.get_column(name)
+
+        if name == "patch_id":
+            return [int(patch_id) for patch_id, _ in self._reader.iter_section_item("patch")]
+        return [patch_data[name] for _, patch_data in self._reader.iter_section_item("patch")]
+
+
+    def iter_patch(self, field_list=None):
+        # (patch id, {field: value}) like repair_data["patch"].items(), only the fields in field_list
+        if self._mapped_matrix is not None:
+            if field_list is None:
+                field_list = self.get_field_list()
+            column_list = [self._mapped_matrix.get_column(field) for field in field_list]
+            for row, patch_id in enumerate(self._mapped_matrix.get_column("patch_id")):
+                yield str(patch_id), {field: column[row] for field, column in zip(field_list, column_list)}
+            return
+
+        for patch_id, patch_data in self._reader.iter_section_item("patch"):
+            if field_list is not None:
+                patch_data = {field: patch_data[field] for field in field_list}
+            yield patch_id, patch_data
+
+
+    def get_patch_dict(self, field_list=None):
+        # the patch section in one parse, faster than iter_patch when it all fits in memory anyway
+        if self._reader is None:
+            return dict(self.iter_patch(field_list))
+
+        patch_dict = self._reader.get_section("patch")
+        if field_list is None:
+            return patch_dict
+        return {patch_id: {field: patch_data[field] for field in field_list} for patch_id, patch_data in patch_dict.items()}
+
+
+    def close(self):
+        if self._mapped_matrix is not None:
+            self._mapped_matrix.close()
+        if self._reader is not None:
+            self._reader.close()